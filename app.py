@@ -1,20 +1,104 @@
+import bisect
 import os
+import queue
+import re
+import shutil
 import sqlite3
+import codecs
 import csv
 import io
+import gzip
+import hashlib
+import hmac
 import json
-from datetime import datetime
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps
+from itertools import combinations
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+
+import click
 from flask import (
-    Flask, request, redirect, session, url_for,
-    render_template_string, Response
+    Flask, g, request, redirect, session, url_for,
+    render_template, Response, flash, make_response, jsonify, send_file
 )
+from jinja2 import DictLoader
+from markupsafe import Markup
+
+try:
+    import numpy
+except ImportError:  # optional: vectorizes the trend moving averages
+    numpy = None
 
 app = Flask(__name__)
 
 # Render → Environment
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret")
 TRACKER_PASSWORD = os.getenv("TRACKER_PASSWORD", "changeme")
+# Bearer token for line-side scanners and scripts; the JSON API is session-only if unset
+API_TOKEN = os.getenv("API_TOKEN", "")
+DB_PATH = os.getenv("DB_PATH", "data.db")
+# Entry times are stored as UTC epoch seconds and shown in the plant's time
+# zone (an IANA name). Times written before migration 11 were wall-clock times
+# without a zone and are read as this zone when upgrading.
+PLANT_TZ = os.getenv("PLANT_TZ", "UTC")
+PLANT_ZONE = ZoneInfo(PLANT_TZ)
+# Shift-day trends count a shift on the day it started: entries before this
+# plant hour belong to the previous day's shifts (a night shift running past
+# midnight). 0 counts calendar days.
+SHIFT_DAY_START_HOUR = int(os.getenv("SHIFT_DAY_START_HOUR", "6"))
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+GZIP_MAGIC = b"\x1f\x8b"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+WAL_AUTOCHECKPOINT_PAGES = int(os.getenv("WAL_AUTOCHECKPOINT_PAGES", "1000"))
+WAL_CHECKPOINT_INTERVAL = float(os.getenv("WAL_CHECKPOINT_INTERVAL", "30"))
+WAL_TRUNCATE_BYTES = int(os.getenv("WAL_TRUNCATE_BYTES", str(64 * 1024 * 1024)))
+WRITE_QUEUE = os.getenv("WRITE_QUEUE", "1") != "0"
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+WRITE_BATCH_MAX = 200
+# Seconds a request waits for its write to start before giving up with a 503
+WRITE_TIMEOUT = float(os.getenv("WRITE_TIMEOUT", "30"))
+# The writer confirms a write once it's committed; FULL makes that commit
+# durable. Under WAL, NORMAL never corrupts but can lose the last confirmed
+# commits on power loss, so it's only the default without the write queue.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "FULL" if WRITE_QUEUE else "NORMAL").upper()
+API_MAX_BATCH = 1000
+IDEMPOTENCY_TTL = 24 * 3600
+if SQLITE_JOURNAL_MODE not in ("WAL", "DELETE", "TRUNCATE", "PERSIST"):
+    raise RuntimeError(f"unsupported SQLITE_JOURNAL_MODE: {SQLITE_JOURNAL_MODE}")
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise RuntimeError(f"unsupported SQLITE_SYNCHRONOUS: {SQLITE_SYNCHRONOUS}")
+# Live dashboard updates (/events): how often each worker polls the change
+# feed, and how many streams it serves (each holds a gthread thread)
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "16"))
+EVENTS_HEARTBEAT = 15
+EVENTS_QUEUE_SIZE = 100
+CHANGES_BATCH = 500
+CHANGES_KEPT = 10000
+# Statements at least this slow are logged with their plan; 0 turns the log off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_READ_SIZE = 1 << 16
+IMPORT_ERRORS_SHOWN = 10  # flashed messages live in the session cookie
+# Exports and restores run as background jobs; their files live here
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL = 24 * 3600
+JOB_PROGRESS_INTERVAL = 1.0
+# `flask archive` moves entries from before the last ARCHIVE_RETENTION_MONTHS
+# whole months into one SQLite file per month here
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_RETENTION_MONTHS = int(os.getenv("ARCHIVE_RETENTION_MONTHS", "12"))
 
 # Default dropdown values (used ONLY if the database has none yet)
 DEFAULT_LINE_OPTIONS = [
@@ -123,6 +207,8 @@ APP_HTML = """
     @media (min-width: 980px) { .split { grid-template-columns: 1fr 1fr; } }
     .mini { font-size: 12px; color: rgba(232,238,252,.75); }
     .hr { height:1px; background: rgba(255,255,255,.08); margin: 12px 0; }
+    .flash { padding:10px; border-radius:10px; margin-bottom:8px; border:1px solid rgba(255,255,255,.12); }
+    .flash.error { background: rgba(255, 77, 77, .18); border-color: rgba(255,77,77,.35); }
   </style>
 </head>
 <body>
@@ -141,18 +227,46 @@ APP_HTML = """
 
   <div class="wrap">
 
+    {% with messages = get_flashed_messages(with_categories=true) %}
+      {% for category, message in messages %}
+        <div class="flash {{ category }}">{{ message }}</div>
+      {% endfor %}
+    {% endwith %}
+
     <div class="card">
       <div style="display:flex; flex-wrap:wrap; gap:10px; align-items:center; justify-content:space-between;">
         <div style="display:flex; flex-wrap:wrap; gap:10px;">
-          <span class="pill"><span class="k">Total entries</span> <b>{{ totals.total }}</b></span>
-          <span class="pill"><span class="k">Showing</span> <b>{{ totals.shown }}</b></span>
+          <span class="pill"><span class="k">Total entries</span> <b id="total-count">{{ totals.total }}</b></span>
+          <span class="pill"><span class="k">Showing</span> <b id="shown-count">{{ totals.shown }}</b></span>
         </div>
 
         <div class="actions">
-          <a href="/export.csv" class="btn btn-ghost btn-small">Download CSV</a>
-          <a href="/export.json" class="btn btn-ghost btn-small">Save (Backup)</a>
-          <form method="post" action="/import" enctype="multipart/form-data" style="display:flex; gap:8px; align-items:center;">
-            <input type="file" name="file" accept="application/json" required style="max-width:260px;">
+          <form method="post" action="/jobs">
+            <input type="hidden" name="kind" value="export_csv">
+            {% for name, value in job_filters.items() %}
+              <input type="hidden" name="{{ name }}" value="{{ value }}">
+            {% endfor %}
+            <button class="btn btn-ghost btn-small" type="submit">Download CSV</button>
+          </form>
+          <form method="post" action="/jobs">
+            <input type="hidden" name="kind" value="export_json">
+            <button class="btn btn-ghost btn-small" type="submit">Save (Backup)</button>
+          </form>
+          <form method="post" action="/jobs">
+            <input type="hidden" name="kind" value="export_json_gz">
+            <button class="btn btn-ghost btn-small" type="submit">Save (.gz)</button>
+          </form>
+          <form method="post" action="/jobs" enctype="multipart/form-data" style="display:flex; gap:8px; align-items:center;">
+            <input type="hidden" name="kind" value="import">
+            <input type="file" name="file" accept="application/json,.json,.gz" required style="max-width:260px;">
+            <select name="mode" style="width:auto; margin-top:0;">
+              <option value="replace">Replace all</option>
+              <option value="merge">Merge changes</option>
+            </select>
+            <label style="display:flex; gap:6px; align-items:center;">
+              <input type="checkbox" name="prune" value="1" style="width:auto; margin-top:0;">
+              Merge: delete entries not in backup
+            </label>
             <button class="btn btn-primary btn-small" type="submit">Restore</button>
           </form>
         </div>
@@ -238,7 +352,7 @@ APP_HTML = """
               </select>
             </div>
             <div>
-              <label>Contains (Parts / Reason)</label>
+              <label>Contains (Parts / Reason / Notes)</label>
               <input name="q" value="{{ filters.q }}" placeholder="e.g. bolt, scratch, trim...">
             </div>
           </div>
@@ -265,44 +379,9 @@ APP_HTML = """
         </form>
       </div>
 
-      <div class="card">
-        <h2>Totals</h2>
-        <div class="split">
-          <div>
-            <div class="mini">By Line</div>
-            <table class="table">
-              <thead><tr><th>Line</th><th>Count</th></tr></thead>
-              <tbody>
-                {% for r in totals.by_line %}
-                  <tr><td>{{ r[0] }}</td><td><b>{{ r[1] }}</b></td></tr>
-                {% endfor %}
-              </tbody>
-            </table>
-          </div>
-
-          <div>
-            <div class="mini">By Shift</div>
-            <table class="table">
-              <thead><tr><th>Shift</th><th>Count</th></tr></thead>
-              <tbody>
-                {% for r in totals.by_shift %}
-                  <tr><td>{{ r[0] }}</td><td><b>{{ r[1] }}</b></td></tr>
-                {% endfor %}
-              </tbody>
-            </table>
+      <div id="totals">{{ fragments.totals }}</div>
 
-            <div class="mini" style="margin-top:12px;">Top Reasons (filtered)</div>
-            <table class="table">
-              <thead><tr><th>Reason</th><th>Count</th></tr></thead>
-              <tbody>
-                {% for r in totals.by_reason %}
-                  <tr><td>{{ r[0] }}</td><td><b>{{ r[1] }}</b></td></tr>
-                {% endfor %}
-              </tbody>
-            </table>
-          </div>
-        </div>
-      </div>
+      {{ fragments.trends }}
 
     </div>
 
@@ -323,9 +402,74 @@ APP_HTML = """
             <th>Delete</th>
           </tr>
         </thead>
-        <tbody>
+        <tbody id="entries">
           {% for i in items %}
-            <tr>
+            {% include "row.html" %}
+          {% endfor %}
+        </tbody>
+      </table>
+
+      {% if pager.newer or pager.older %}
+        <div class="actions">
+          {% if pager.first %}<a class="btn btn-ghost btn-small" href="{{ pager.first }}">Newest</a>{% endif %}
+          {% if pager.newer %}<a class="btn btn-ghost btn-small" href="{{ pager.newer }}">&larr; Newer</a>{% endif %}
+          {% if pager.older %}<a class="btn btn-ghost btn-small" href="{{ pager.older }}">Older &rarr;</a>{% endif %}
+        </div>
+      {% endif %}
+    </div>
+
+    <div class="card" style="margin-top:14px;">
+      <h2>Manage dropdowns</h2>
+      <div class="list-muted">These are saved in the database and included in backups.</div>
+
+      <div class="split" style="margin-top:10px;">
+        {{ fragments.dropdowns }}
+        <div class="hr"></div>
+        <div id="bars">{{ fragments.bars }}</div>
+ 
+       
+      </div>
+    </div>
+
+  </div>
+  <script>
+    // Live updates pushed from /events; without them the page still works on reload
+    (function () {
+      if (!window.EventSource) return;
+      var atNewest = {{ "true" if not pager.first else "false" }};
+      var query = new URLSearchParams(location.search);
+      ["before", "after", "per_page"].forEach(function (k) { query.delete(k); });
+      query.set("since", "{{ events_since }}");
+      var source = new EventSource("/events?" + query.toString());
+
+      source.addEventListener("change", function (e) {
+        var d = JSON.parse(e.data);
+        d.deleted.forEach(function (id) {
+          var row = document.getElementById("item-" + id);
+          if (row) row.remove();
+        });
+        if (atNewest && d.added.length) {
+          document.getElementById("entries").insertAdjacentHTML("afterbegin", d.added.join(""));
+        }
+        document.getElementById("totals").innerHTML = d.totals;
+        document.getElementById("bars").innerHTML = d.bars;
+        document.getElementById("total-count").textContent = d.total;
+        document.getElementById("shown-count").textContent = d.shown;
+      });
+      // Too much changed (a restore, or the stream fell behind): start over
+      source.addEventListener("reload", function () {
+        source.close();
+        location.reload();
+      });
+    })();
+  </script>
+</body>
+</html>
+"""
+
+# Fragments rendered separately so home() can cache them (see cached_fragment)
+ROW_HTML = """
+            <tr id="item-{{ i['id'] }}">
               <td class="muted">{{ i["created_at"] }}</td>
               <td><b>{{ i["parts"] }}</b></td>
               <td>{{ i["line"] }}</td>
@@ -344,21 +488,144 @@ APP_HTML = """
                 </details>
               </td>
               <td>
+                {% if i["archived"] %}
+                <span class="mini">Archived</span>
+                {% else %}
                 <form method="post" action="/delete/{{ i['id'] }}">
                   <button class="btn btn-danger btn-small" type="submit">Delete</button>
                 </form>
+                {% endif %}
               </td>
             </tr>
+"""
+
+TOTALS_HTML = """
+      <div class="card">
+        <h2>Totals</h2>
+        <div class="split">
+          <div>
+            <div class="mini">By Line</div>
+            <table class="table">
+              <thead><tr><th>Line</th><th>Count</th></tr></thead>
+              <tbody>
+                {% for r in totals.by_line %}
+                  <tr><td>{{ r[0] }}</td><td><b>{{ r[1] }}</b></td></tr>
+                {% endfor %}
+              </tbody>
+            </table>
+          </div>
+
+          <div>
+            <div class="mini">By Shift</div>
+            <table class="table">
+              <thead><tr><th>Shift</th><th>Count</th></tr></thead>
+              <tbody>
+                {% for r in totals.by_shift %}
+                  <tr><td>{{ r[0] }}</td><td><b>{{ r[1] }}</b></td></tr>
+                {% endfor %}
+              </tbody>
+            </table>
+
+            <div class="mini" style="margin-top:12px;">Top Reasons (filtered)</div>
+            <table class="table">
+              <thead><tr><th>Reason</th><th>Count</th></tr></thead>
+              <tbody>
+                {% for r in totals.by_reason %}
+                  <tr><td>{{ r[0] }}</td><td><b>{{ r[1] }}</b></td></tr>
+                {% endfor %}
+              </tbody>
+            </table>
+          </div>
+        </div>
+      </div>
+"""
+
+TRENDS_HTML = """
+      <div class="card" style="margin-top:14px;">
+        <h2>Trends</h2>
+        <div class="actions" style="margin-top:0;">
+          {% for name, label, url in trend_links %}
+            <a class="btn btn-small {{ 'btn-primary' if name == bucket else 'btn-ghost' }}" href="{{ url }}">{{ label }}</a>
           {% endfor %}
-        </tbody>
-      </table>
-    </div>
+        </div>
+        {% if error %}
+          <div class="muted" style="margin-top:10px;">{{ error }}</div>
+        {% else %}
+          <div class="list-muted">
+            Scrap per {{ bucket_label }}, {{ chart.first }} to {{ chart.last }};
+            line: {{ window }}-{{ bucket_label }} moving average.
+          </div>
+          <svg viewBox="0 0 {{ chart.width }} {{ chart.height }}" preserveAspectRatio="none"
+               style="width:100%; height:140px; margin-top:10px; background:#0f1730; border-radius:10px;">
+            {% for b in chart.bars %}
+              <rect x="{{ b.x }}" y="{{ chart.height - b.h }}" width="8" height="{{ b.h }}" fill="#2c4699"><title>{{ b.label }}: {{ b.n }}</title></rect>
+            {% endfor %}
+            <polyline points="{{ chart.line }}" fill="none" stroke="#ffcf5a" stroke-width="2" vector-effect="non-scaling-stroke"/>
+          </svg>
+          <table class="table" style="margin-top:10px;">
+            <thead><tr><th>{{ group_label }}</th><th>Total</th><th>Trend</th><th>Latest avg</th></tr></thead>
+            <tbody>
+              {% for s in chart.series %}
+                <tr>
+                  <td>{{ s.key }}</td>
+                  <td><b>{{ s.sum }}</b></td>
+                  <td style="width:40%;">
+                    <svg viewBox="0 0 {{ chart.width }} {{ chart.height }}" preserveAspectRatio="none" style="width:100%; height:24px;">
+                      <polyline points="{{ s.line }}" fill="none" stroke="#4f7cff" stroke-width="2" vector-effect="non-scaling-stroke"/>
+                    </svg>
+                  </td>
+                  <td>{{ s.last }}</td>
+                </tr>
+              {% endfor %}
+            </tbody>
+          </table>
+        {% endif %}
+      </div>
+"""
 
-    <div class="card" style="margin-top:14px;">
-      <h2>Manage dropdowns</h2>
-      <div class="list-muted">These are saved in the database and included in backups.</div>
+BARS_HTML = """
+<h2>Bar charts</h2>
+<div class="split">
+<div>
+<div class="mini">By Line (filtered)</div>
 
-      <div class="split" style="margin-top:10px;">
+    {% for b in line_bars %}
+<div style="margin: 10px 0;">
+<div class="k">{{ b.label }} — <b>{{ b.value }}</b></div>
+<div style="background:#1b2646;border-radius:8px;overflow:hidden;">
+<div style="height:18px;width:{{ b.percent }}%;background:#4f7cff;"></div>
+</div>
+</div>
+
+    {% endfor %}
+
+    {% if not line_bars %}
+<div class="muted">No data to chart.</div>
+
+    {% endif %}
+</div>
+<div>
+<div class="mini">By Shift (filtered)</div>
+
+    {% for b in shift_bars %}
+<div style="margin: 10px 0;">
+<div class="k">{{ b.label }} — <b>{{ b.value }}</b></div>
+<div style="background:#1b2646;border-radius:8px;overflow:hidden;">
+<div style="height:18px;width:{{ b.percent }}%;background:#34d399;"></div>
+</div>
+</div>
+
+    {% endfor %}
+
+    {% if not shift_bars %}
+<div class="muted">No data to chart.</div>
+
+    {% endif %}
+</div>
+</div>
+"""
+
+DROPDOWNS_HTML = """
         <div class="card" style="background:#0f1730;">
           <h2>Lines</h2>
           <form method="post" action="/options/add">
@@ -412,57 +679,105 @@ APP_HTML = """
             </tbody>
           </table>
         </div>
-        <div class="hr"></div>
-<h2>Bar charts</h2>
-<div class="split">
-<div>
-<div class="mini">By Line (filtered)</div>
-
-    {% for b in line_bars %}
-<div style="margin: 10px 0;">
-<div class="k">{{ b.label }} — <b>{{ b.value }}</b></div>
-<div style="background:#1b2646;border-radius:8px;overflow:hidden;">
-<div style="height:18px;width:{{ b.percent }}%;background:#4f7cff;"></div>
-</div>
-</div>
+"""
 
-    {% endfor %}
+JOB_HTML = """
+<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width,initial-scale=1">
+  {% if job.status in ("queued", "running") %}<meta http-equiv="refresh" content="2">{% endif %}
+  <title>Tracker - {{ title }}</title>
+  <style>
+    body { font-family: Arial, sans-serif; background:#0b1220; color:#e8eefc; margin:0; }
+    .wrap { max-width: 520px; margin: 64px auto; padding: 0 16px; }
+    .card { background:#121b2f; border:1px solid rgba(255,255,255,.08); border-radius:14px; padding:18px; }
+    h1 { margin:0 0 10px; font-size: 26px; }
+    a { color:#9bb6ff; }
+    .muted { color: rgba(232,238,252,.75); }
+    .btn { display:inline-block; padding:12px 14px; border-radius:10px; background:#4f7cff; color:white; font-weight:700; text-decoration:none; margin-top:10px; }
+    .error { background: rgba(255, 77, 77, .18); border:1px solid rgba(255,77,77,.35); padding:10px; border-radius:10px; margin-top:10px; }
+    .ok { background: rgba(77, 255, 136, .12); border:1px solid rgba(77,255,136,.30); padding:10px; border-radius:10px; margin-top:10px; }
+  </style>
+</head>
+<body>
+  <div class="wrap">
+    <div class="card">
+      <h1>{{ title }}</h1>
+      {% if job.status == "queued" %}
+        <p class="muted">Waiting to start...</p>
+      {% elif job.status == "running" %}
+        <p class="muted">
+          Working: {{ job.progress }}{% if job.total %} of {{ job.total }} {{ job.unit }}
+          ({{ (100 * job.progress // job.total) if job.total else 0 }}%){% else %} {{ job.unit }}{% endif %}
+        </p>
+      {% elif job.status == "failed" %}
+        <div class="error">Failed: {{ job.error }}</div>
+      {% elif job.download %}
+        <div class="ok">Ready.</div>
+        <a class="btn" href="{{ job.download }}">Download</a>
+      {% elif errors %}
+        <div class="error">Restore failed, nothing was changed.</div>
+        {% for number, message in errors %}
+          <div class="error">{% if number %}Entry {{ number }}: {% endif %}{{ message }}</div>
+        {% endfor %}
+      {% else %}
+        <div class="ok">{{ summary }}</div>
+      {% endif %}
+      <p><a href="/">Back to the tracker</a></p>
+    </div>
+  </div>
+</body>
+</html>
+"""
 
-    {% if not line_bars %}
-<div class="muted">No data to chart.</div>
+# Compiled once per process by Jinja's template cache instead of on every request
+app.jinja_loader = DictLoader({
+    "login.html": LOGIN_HTML,
+    "app.html": APP_HTML,
+    "row.html": ROW_HTML,
+    "totals.html": TOTALS_HTML,
+    "bars.html": BARS_HTML,
+    "trends.html": TRENDS_HTML,
+    "dropdowns.html": DROPDOWNS_HTML,
+    "job.html": JOB_HTML,
+})
 
-    {% endif %}
-</div>
-<div>
-<div class="mini">By Shift (filtered)</div>
+FRAGMENT_CACHE_SIZE = 256
 
-    {% for b in shift_bars %}
-<div style="margin: 10px 0;">
-<div class="k">{{ b.label }} — <b>{{ b.value }}</b></div>
-<div style="background:#1b2646;border-radius:8px;overflow:hidden;">
-<div style="height:18px;width:{{ b.percent }}%;background:#34d399;"></div>
-</div>
-</div>
+_fragments = OrderedDict()
+_fragment_generations = {}
+_fragments_lock = threading.Lock()
 
-    {% endfor %}
+def cached_fragment(group, key, build):
+    # Per-process LRU of rendered page fragments. A write bumps the group's
+    # generation, so a render that raced with it is never stored.
+    with _fragments_lock:
+        value = _fragments.get((group, key))
+        if value is not None:
+            _fragments.move_to_end((group, key))
+            return value
+        generation = _fragment_generations.get(group, 0)
 
-    {% if not shift_bars %}
-<div class="muted">No data to chart.</div>
+    value = build()
 
-    {% endif %}
-</div>
-</div>
- 
-       
-      </div>
-    </div>
+    with _fragments_lock:
+        if _fragment_generations.get(group, 0) == generation:
+            _fragments[(group, key)] = value
+            while len(_fragments) > FRAGMENT_CACHE_SIZE:
+                _fragments.popitem(last=False)
+    return value
 
-  </div>
-</body>
-</html>
-"""
+def invalidate_fragments(*groups):
+    with _fragments_lock:
+        for group in groups:
+            _fragment_generations[group] = _fragment_generations.get(group, 0) + 1
+        for key in [k for k in _fragments if k[0] in groups]:
+            del _fragments[key]
 
 def ensure_default_options(conn, group, defaults):
+    # Returns whether the defaults were seeded
     cur = conn.execute("SELECT COUNT(*) AS c FROM options WHERE opt_group=?", (group,))
     count = cur.fetchone()[0]
     if count == 0:
@@ -471,6 +786,7 @@ def ensure_default_options(conn, group, defaults):
                 "INSERT OR IGNORE INTO options (opt_group, opt_value) VALUES (?, ?)",
                 (group, v.strip())
             )
+    return count == 0
 
 def get_options(conn, group):
     rows = conn.execute(
@@ -479,14 +795,114 @@ def get_options(conn, group):
     ).fetchall()
     return [r[0] for r in rows]
 
+def bump_versions(conn, *keys):
+    # Call inside the writing transaction, before commit; also stamps changed_at
+    # (epoch seconds to the millisecond, see is_not_modified)
+    conn.execute(
+        f"""
+        UPDATE meta
+        SET value = CASE WHEN key = 'changed_at' THEN (julianday('now') - 2440587.5) * 86400.0
+                         ELSE value + 1 END
+        WHERE key IN ('changed_at', {','.join('?' * len(keys))})
+        """,
+        keys
+    )
+
+def publish_changes(conn, kind, item_ids=(None,)):
+    # Feed for /events: "add"/"delete" per entry, or one "reload" when too much
+    # changed to describe. Call inside the writing transaction, like bump_versions.
+    conn.executemany("INSERT INTO changes (kind, item_id) VALUES (?, ?)", [(kind, i) for i in item_ids])
+    conn.execute("DELETE FROM changes WHERE id <= (SELECT MAX(id) FROM changes) - ?", (CHANGES_KEPT,))
+
+_seen_versions = {}
+_options_cache = {}
+_versions_lock = threading.Lock()
+
+def data_versions(conn):
+    # One cheap read per request; drops whatever process-local caches another
+    # worker (or thread) has made stale since this process last looked
+    if "data_versions" in g:
+        return g.data_versions
+
+    current = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    with _versions_lock:
+        changed = {k for k, v in current.items() if _seen_versions.get(k) != v}
+        if "options" in changed:
+            _options_cache.clear()
+        _seen_versions.update(current)
+    if "options" in changed:
+        invalidate_fragments("dropdowns")
+    if "items" in changed:
+        invalidate_fragments("totals")
+
+    g.data_versions = current
+    return current
+
+# Output only changes with the data or with these templates
+ETAG_SALT = hashlib.sha1(
+    "".join([APP_HTML, ROW_HTML, TOTALS_HTML, TRENDS_HTML, BARS_HTML, DROPDOWNS_HTML, str(PAGE_SIZE)]).encode("utf-8")
+).hexdigest()
+
+def validators(versions, *scope):
+    # Strong ETag from the change counters plus whatever else shapes the body
+    # (path and query string). Last-Modified is the whole second after the last
+    # write, and is only sent once that second (and a commit's worth of slack)
+    # is over: a later write then always falls on or after it.
+    token = "|".join(str(p) for p in (ETAG_SALT, versions["items"], versions["options"]) + scope)
+    etag = hashlib.sha1(token.encode("utf-8")).hexdigest()
+    after = int(versions["changed_at"]) + 1
+    return etag, datetime.fromtimestamp(after, timezone.utc) if after < time.time() - 1 else None
+
+def is_not_modified(etag, changed_at):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    # Strictly before: If-Modified-Since has whole seconds, and a write later
+    # in that same second is still a change
+    since = request.if_modified_since
+    return since is not None and changed_at < since.timestamp()
+
+def with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Always revalidate: the point is a cheap 304, not serving stale data
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def conditional_get(conn, *scope):
+    # (304 response or None, etag, last_modified) for the current GET. Only
+    # reads meta, so an unchanged dashboard or export never touches items.
+    versions = data_versions(conn)
+    etag, last_modified = validators(versions, request.full_path, *scope)
+    if is_not_modified(etag, versions["changed_at"]):
+        return with_validators(Response(status=304), etag, last_modified), etag, last_modified
+    return None, etag, last_modified
+
+def option_lists(conn):
+    # Both dropdown lists from the process cache, refilled in one query when
+    # the options version moves
+    version = data_versions(conn)["options"]
+    with _versions_lock:
+        cached = _options_cache.get(version)
+    if cached is None:
+        cached = {"line": [], "shift": []}
+        for r in conn.execute(
+            "SELECT opt_group, opt_value FROM options WHERE opt_group IN ('line','shift') "
+            "ORDER BY opt_value ASC"
+        ):
+            cached[r["opt_group"]].append(r["opt_value"])
+        with _versions_lock:
+            if _seen_versions.get("options") == version:
+                _options_cache[version] = cached
+    return cached["line"], cached["shift"]
+
 def column_exists(conn, table, col):
     cols = conn.execute(f"PRAGMA table_info({table})").fetchall()
     return any(c[1] == col for c in cols)
 
-def db():
-    conn = sqlite3.connect("data.db")
-    conn.row_factory = sqlite3.Row
-
+def migration_base_schema(conn):
+    # Databases created before schema versioning already have these tables
     conn.execute("""
       CREATE TABLE IF NOT EXISTS items (
         id INTEGER PRIMARY KEY,
@@ -508,18 +924,1169 @@ def db():
       )
     """)
 
-    # Migrate schema
     if not column_exists(conn, "items", "notes"):
         conn.execute("ALTER TABLE items ADD COLUMN notes TEXT")
     if not column_exists(conn, "items", "comments"):
         conn.execute("ALTER TABLE items ADD COLUMN comments TEXT")
 
-    ensure_default_options(conn, "line", DEFAULT_LINE_OPTIONS)
-    ensure_default_options(conn, "shift", DEFAULT_SHIFT_OPTIONS)
+# Secondary indexes for the apply_filters_sql paths, until migration 10 moves
+# them to item_data (ITEM_DATA_INDEXES, later ITEM_DATA_TS_INDEXES)
+ITEM_INDEXES = {
+    "idx_items_created_at": "items(created_at)",
+    "idx_items_line_created": "items(line, created_at)",
+    "idx_items_shift_created": "items(shift, created_at)",
+}
 
-    conn.commit()
+def migration_filter_indexes(conn):
+    for name, columns in ITEM_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+
+FTS_COLUMNS = ("parts", "reason", "notes", "comments")
+
+def migration_fulltext(conn):
+    # External-content FTS5 index over items, kept in sync by triggers so every
+    # write path (add, delete, import) is covered without extra code
+    try:
+        conn.execute(f"""
+          CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+            {", ".join(FTS_COLUMNS)}, content='items', content_rowid='id'
+          )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: searches keep using LIKE
+        return
+
+    cols = ", ".join(FTS_COLUMNS)
+    new = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    conn.execute(f"""
+      CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts (rowid, {cols}) VALUES (new.id, {new});
+      END
+    """)
+    conn.execute(f"""
+      CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+      END
+    """)
+    conn.execute(f"""
+      CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+        INSERT INTO items_fts (rowid, {cols}) VALUES (new.id, {new});
+      END
+    """)
+    conn.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+
+# Per-day counts for the dashboard totals; created_at starts with "YYYY-MM-DD"
+ROLLUP_SELECT = """
+    SELECT substr(created_at, 1, 10) AS day, line, shift, reason, COUNT(*) AS n
+    FROM items
+    GROUP BY 1, 2, 3, 4
+"""
+
+def migration_rollup(conn):
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS item_rollup (
+        day TEXT NOT NULL,
+        line TEXT NOT NULL,
+        shift TEXT NOT NULL,
+        reason TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (day, line, shift, reason)
+      ) WITHOUT ROWID
+    """)
+
+    add = """
+        INSERT INTO item_rollup (day, line, shift, reason, n)
+        VALUES (substr(new.created_at, 1, 10), new.line, new.shift, new.reason, 1)
+        ON CONFLICT (day, line, shift, reason) DO UPDATE SET n = n + 1;
+    """
+    key = """
+        day = substr(old.created_at, 1, 10) AND line = old.line
+        AND shift = old.shift AND reason = old.reason
+    """
+    remove = f"""
+        UPDATE item_rollup SET n = n - 1 WHERE {key};
+        DELETE FROM item_rollup WHERE {key} AND n <= 0;
+    """
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS item_rollup_insert AFTER INSERT ON items BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS item_rollup_delete AFTER DELETE ON items BEGIN {remove} END")
+    conn.execute(f"""
+      CREATE TRIGGER IF NOT EXISTS item_rollup_update
+      AFTER UPDATE OF created_at, line, shift, reason ON items BEGIN {remove} {add} END
+    """)
+
+    conn.execute("DELETE FROM item_rollup")
+    conn.execute(f"INSERT INTO item_rollup (day, line, shift, reason, n) {ROLLUP_SELECT}")
+
+def migration_meta(conn):
+    # Change counters bumped by every write path (see bump_versions), so each
+    # worker can tell cheaply whether its process-local caches are stale
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+      )
+    """)
+    conn.executemany(
+        "INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)",
+        [("items",), ("options",)]
+    )
+
+def migration_changed_at(conn):
+    # Unix time of the last write, for Last-Modified
+    conn.execute(
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('changed_at', CAST(strftime('%s', 'now') AS INTEGER))"
+    )
+
+def migration_idempotency_keys(conn):
+    # Responses to POST /api/items batches sent with an Idempotency-Key header
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        request_hash TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at INTEGER NOT NULL
+      )
+    """)
+
+def migration_jobs(conn):
+    # Background exports and restores (see start_job); pid is the worker running it
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        params TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        progress INTEGER NOT NULL DEFAULT 0,
+        total INTEGER,
+        result TEXT,
+        error TEXT,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+      )
+    """)
+
+def migration_changes(conn):
+    # Change feed for /events; every worker's poller reads it (see publish_changes)
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        item_id INTEGER
+      )
+    """)
+
+# Since migration 10, items is a view over item_data, which stores line,
+# reason and shift as ids into these interned dictionary tables:
+# (view column, dictionary table, position in an item row)
+ITEM_DICTIONARIES = (("line", "lines", 2), ("reason", "reasons", 3), ("shift", "shifts", 5))
+
+ITEM_DATA_INDEXES = {
+    "idx_item_data_created_at": "item_data(created_at)",
+    "idx_item_data_line_created": "item_data(line_id, created_at)",
+    "idx_item_data_shift_created": "item_data(shift_id, created_at)",
+}
+
+# Migration 11 rebuilds item_data with created_ts and these in place of
+# ITEM_DATA_INDEXES; `flask check-indexes` verifies them
+ITEM_DATA_TS_INDEXES = {
+    "idx_item_data_created_ts": "item_data(created_ts)",
+    "idx_item_data_line_created_ts": "item_data(line_id, created_ts)",
+    "idx_item_data_shift_created_ts": "item_data(shift_id, created_ts)",
+}
+
+def dictionary_id(column, value):
+    table = next(t for c, t, _ in ITEM_DICTIONARIES if c == column)
+    return f"(SELECT id FROM {table} WHERE name = {value})"
+
+def dictionary_name(column, value):
+    table = next(t for c, t, _ in ITEM_DICTIONARIES if c == column)
+    return f"(SELECT name FROM {table} WHERE id = {value})"
+
+def migration_dictionary_encoding(conn):
+    # Rebuild items as item_data with integer keys, behind a view with the old
+    # name and columns so every reader (filters, exports, FTS content) is unchanged.
+    # Dictionary rows are never deleted, so an id always resolves.
+    for _, table, _ in ITEM_DICTIONARIES:
+        conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    for column, table, _ in ITEM_DICTIONARIES:
+        conn.execute(f"INSERT INTO {table} (name) SELECT DISTINCT {column} FROM items ORDER BY 1")
+
+    conn.execute("""
+      CREATE TABLE item_data (
+        id INTEGER PRIMARY KEY,
+        parts TEXT NOT NULL,
+        line_id INTEGER NOT NULL REFERENCES lines (id),
+        reason_id INTEGER NOT NULL REFERENCES reasons (id),
+        sequence INTEGER NOT NULL,
+        shift_id INTEGER NOT NULL REFERENCES shifts (id),
+        created_at TEXT NOT NULL,
+        notes TEXT,
+        comments TEXT
+      )
+    """)
+    conn.execute("""
+      INSERT INTO item_data (id, parts, line_id, reason_id, sequence, shift_id, created_at, notes, comments)
+      SELECT i.id, i.parts, l.id, r.id, i.sequence, s.id, i.created_at, i.notes, i.comments
+      FROM items i
+      JOIN lines l ON l.name = i.line
+      JOIN reasons r ON r.name = i.reason
+      JOIN shifts s ON s.name = i.shift
+    """)
+    # Takes its indexes and the FTS/rollup triggers with it
+    conn.execute("DROP TABLE items")
+    for name, columns in ITEM_DATA_INDEXES.items():
+        conn.execute(f"CREATE INDEX {name} ON {columns}")
+
+    # Names are scalar subqueries rather than joins: the view is flattened into
+    # each query, so a name is only looked up when the query uses it. The ids
+    # come last so equality filters and GROUP BYs can use them directly.
+    conn.execute(f"""
+      CREATE VIEW items AS
+      SELECT id, parts, {dictionary_name("line", "line_id")} AS line,
+             {dictionary_name("reason", "reason_id")} AS reason, sequence,
+             {dictionary_name("shift", "shift_id")} AS shift,
+             created_at, notes, comments, line_id, reason_id, shift_id
+      FROM item_data
+    """)
+
+    # Writes through the view keep working for scripts and the sqlite3 shell;
+    # the app itself writes item_data directly (see insert_items)
+    intern = " ".join(
+        f"INSERT OR IGNORE INTO {table} (name) VALUES (new.{column});"
+        for column, table, _ in ITEM_DICTIONARIES
+    )
+    conn.execute(f"""
+      CREATE TRIGGER items_view_insert INSTEAD OF INSERT ON items BEGIN
+        {intern}
+        INSERT INTO item_data (id, parts, line_id, reason_id, sequence, shift_id, created_at, notes, comments)
+        VALUES (new.id, new.parts, {dictionary_id("line", "new.line")}, {dictionary_id("reason", "new.reason")},
+                new.sequence, {dictionary_id("shift", "new.shift")}, new.created_at, new.notes, new.comments);
+      END
+    """)
+    conn.execute(f"""
+      CREATE TRIGGER items_view_update INSTEAD OF UPDATE ON items BEGIN
+        {intern}
+        UPDATE item_data SET
+          id = new.id, parts = new.parts, line_id = {dictionary_id("line", "new.line")},
+          reason_id = {dictionary_id("reason", "new.reason")}, sequence = new.sequence,
+          shift_id = {dictionary_id("shift", "new.shift")}, created_at = new.created_at,
+          notes = new.notes, comments = new.comments
+        WHERE id = old.id;
+      END
+    """)
+    conn.execute("""
+      CREATE TRIGGER items_view_delete INSTEAD OF DELETE ON items BEGIN
+        DELETE FROM item_data WHERE id = old.id;
+      END
+    """)
+
+    # The FTS index and rollup keep their contents (same ids, same values);
+    # only their triggers move to item_data, resolving names through the dictionaries
+    def names(row):
+        values = {c: f"{row}.{c}" for c in ("parts", "notes", "comments", "created_at")}
+        for column, _, _ in ITEM_DICTIONARIES:
+            values[column] = dictionary_name(column, f"{row}.{column}_id")
+        return values
+
+    new, old = names("new"), names("old")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='items_fts'").fetchone():
+        cols = ", ".join(FTS_COLUMNS)
+        new_fts = ", ".join(new[c] for c in FTS_COLUMNS)
+        old_fts = ", ".join(old[c] for c in FTS_COLUMNS)
+        conn.execute(f"""
+          CREATE TRIGGER item_data_fts_insert AFTER INSERT ON item_data BEGIN
+            INSERT INTO items_fts (rowid, {cols}) VALUES (new.id, {new_fts});
+          END
+        """)
+        conn.execute(f"""
+          CREATE TRIGGER item_data_fts_delete AFTER DELETE ON item_data BEGIN
+            INSERT INTO items_fts (items_fts, rowid, {cols}) VALUES ('delete', old.id, {old_fts});
+          END
+        """)
+        conn.execute(f"""
+          CREATE TRIGGER item_data_fts_update AFTER UPDATE ON item_data BEGIN
+            INSERT INTO items_fts (items_fts, rowid, {cols}) VALUES ('delete', old.id, {old_fts});
+            INSERT INTO items_fts (rowid, {cols}) VALUES (new.id, {new_fts});
+          END
+        """)
+
+    add = f"""
+        INSERT INTO item_rollup (day, line, shift, reason, n)
+        VALUES (substr(new.created_at, 1, 10), {new["line"]}, {new["shift"]}, {new["reason"]}, 1)
+        ON CONFLICT (day, line, shift, reason) DO UPDATE SET n = n + 1;
+    """
+    key = f"""
+        day = substr(old.created_at, 1, 10) AND line = {old["line"]}
+        AND shift = {old["shift"]} AND reason = {old["reason"]}
+    """
+    remove = f"""
+        UPDATE item_rollup SET n = n - 1 WHERE {key};
+        DELETE FROM item_rollup WHERE {key} AND n <= 0;
+    """
+    conn.execute(f"CREATE TRIGGER item_data_rollup_insert AFTER INSERT ON item_data BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER item_data_rollup_delete AFTER DELETE ON item_data BEGIN {remove} END")
+    conn.execute(f"""
+      CREATE TRIGGER item_data_rollup_update
+      AFTER UPDATE OF created_at, line_id, shift_id, reason_id ON item_data BEGIN {remove} {add} END
+    """)
+
+# Plant time in SQL: plant_offsets lists the UTC offset of PLANT_TZ from each
+# change (DST, law) on, so triggers, the items view and the sqlite3 shell can
+# convert without Python. starts/local_starts are the UTC and plant epoch
+# seconds at which each offset takes effect.
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+ZONE_YEARS = (1970, 2100)
+EARLIEST = -(1 << 62)
+
+def plant_today():
+    return datetime.now(PLANT_ZONE).date()
+
+def plant_epoch(text):
+    # "YYYY-MM-DD HH:MM:SS" (or any ISO 8601 date/time) in plant time, unless
+    # it carries its own offset, to UTC epoch seconds
+    value = datetime.fromisoformat(text)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=PLANT_ZONE)
+    return int(value.timestamp())
+
+def parse_day(text):
+    # A "YYYY-MM-DD" date, the one form every date filter takes; ValueError otherwise
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", text):
+        raise ValueError(f"not a YYYY-MM-DD date: {text!r}")
+    return date.fromisoformat(text)
+
+def plant_midnight(day):
+    # Start of a plant "YYYY-MM-DD" day in epoch seconds
+    return int(datetime.combine(parse_day(day), datetime.min.time(), PLANT_ZONE).timestamp())
+
+def zone_transitions(zone):
+    # (UTC epoch, offset seconds) for the offset in force at the start of
+    # ZONE_YEARS and every change after it: daily steps, bisected to the second
+    def offset(ts):
+        return int(datetime.fromtimestamp(ts, zone).utcoffset().total_seconds())
+
+    start = int(datetime(ZONE_YEARS[0], 1, 1, tzinfo=timezone.utc).timestamp())
+    end = int(datetime(ZONE_YEARS[1], 1, 1, tzinfo=timezone.utc).timestamp())
+    changes = [(EARLIEST, offset(start))]
+    for day in range(start, end, 86400):
+        if offset(day + 86400) != changes[-1][1]:
+            low, high = day, day + 86400
+            while high - low > 1:
+                middle = (low + high) // 2
+                low, high = (middle, high) if offset(middle) == changes[-1][1] else (low, middle)
+            changes.append((high, offset(high)))
+    return changes
+
+_plant_transitions = []
+
+def plant_transitions():
+    if not _plant_transitions:
+        _plant_transitions.extend(zone_transitions(PLANT_ZONE))
+    return _plant_transitions
+
+def fill_plant_offsets(conn):
+    conn.execute("DELETE FROM plant_offsets")
+    conn.executemany(
+        "INSERT INTO plant_offsets (starts, local_starts, utc_offset, zone) VALUES (?, ?, ?, ?)",
+        [(ts, ts + offset, offset, PLANT_TZ) for ts, offset in plant_transitions()]
+    )
+
+def plant_offset_sql(ts):
+    return f"(SELECT utc_offset FROM plant_offsets WHERE starts <= {ts} ORDER BY starts DESC LIMIT 1)"
+
+def plant_offset_case_sql(ts, start, end):
+    # The same offset as plain arithmetic for ts known to lie in [start, end):
+    # a CASE over the few changes in between, no subquery per row
+    changes = plant_transitions()
+    starts = [s for s, _ in changes]
+    window = changes[bisect.bisect_right(starts, start) - 1:bisect.bisect_left(starts, end)]
+    if len(window) == 1:
+        return str(window[0][1])
+    cases = " ".join(f"WHEN {ts} < {s} THEN {offset}" for (_, offset), (s, _) in zip(window, window[1:]))
+    return f"(CASE {cases} ELSE {window[-1][1]} END)"
+
+def plant_strftime_sql(fmt, ts):
+    # SQL formatting epoch seconds ts as plant time
+    return f"strftime('{fmt}', {ts} + {plant_offset_sql(ts)}, 'unixepoch')"
+
+def plant_epoch_sql(text):
+    # SQL reading a plant "YYYY-MM-DD HH:MM:SS" as epoch seconds (NULL if it isn't one).
+    # A repeated hour when clocks go back is read as the second one.
+    local = f"CAST(strftime('%s', {text}) AS INTEGER)"
+    return (f"{local} - (SELECT utc_offset FROM plant_offsets WHERE local_starts <= {local} "
+            f"ORDER BY local_starts DESC LIMIT 1)")
+
+def sync_plant_zone(conn):
+    # After a PLANT_TZ change: new offsets, and rollup days and hours in the new zone
+    zone = conn.execute("SELECT zone FROM plant_offsets LIMIT 1").fetchone()
+    if zone and zone[0] == PLANT_TZ:
+        return
+    fill_plant_offsets(conn)
+    refill_rollups(conn)
+    bump_versions(conn, "items")
+
+def item_columns_sql():
+    # The items view's columns over an item_data table (live or archived)
+    return f"""
+      id, parts, {dictionary_name("line", "line_id")} AS line,
+      {dictionary_name("reason", "reason_id")} AS reason, sequence,
+      {dictionary_name("shift", "shift_id")} AS shift,
+      {plant_strftime_sql(TIME_FORMAT, "created_ts")} AS created_at,
+      notes, comments, line_id, reason_id, shift_id, created_ts
+    """
+
+def create_items_view(conn):
+    # items over item_data: names through the dictionaries, created_at as plant
+    # time. The view is flattened into each query, so a name or a formatted time
+    # is only computed for the rows and columns a query actually returns.
+    conn.execute(f"CREATE VIEW items AS SELECT {item_columns_sql()} FROM item_data")
+
+    # Writes through the view keep working for scripts and the sqlite3 shell,
+    # taking created_ts or else a plant created_at; the app writes item_data
+    intern = " ".join(
+        f"INSERT OR IGNORE INTO {table} (name) VALUES (new.{column});"
+        for column, table, _ in ITEM_DICTIONARIES
+    )
+    conn.execute(f"""
+      CREATE TRIGGER items_view_insert INSTEAD OF INSERT ON items BEGIN
+        {intern}
+        INSERT INTO item_data (id, parts, line_id, reason_id, sequence, shift_id, created_ts, notes, comments)
+        VALUES (new.id, new.parts, {dictionary_id("line", "new.line")}, {dictionary_id("reason", "new.reason")},
+                new.sequence, {dictionary_id("shift", "new.shift")},
+                COALESCE(new.created_ts, {plant_epoch_sql("new.created_at")}, CAST(strftime('%s', 'now') AS INTEGER)),
+                new.notes, new.comments);
+      END
+    """)
+    conn.execute(f"""
+      CREATE TRIGGER items_view_update INSTEAD OF UPDATE ON items BEGIN
+        {intern}
+        UPDATE item_data SET
+          id = new.id, parts = new.parts, line_id = {dictionary_id("line", "new.line")},
+          reason_id = {dictionary_id("reason", "new.reason")}, sequence = new.sequence,
+          shift_id = {dictionary_id("shift", "new.shift")},
+          created_ts = CASE
+            WHEN new.created_ts IS NOT old.created_ts THEN new.created_ts
+            WHEN new.created_at IS NOT old.created_at THEN {plant_epoch_sql("new.created_at")}
+            ELSE old.created_ts END,
+          notes = new.notes, comments = new.comments
+        WHERE id = old.id;
+      END
+    """)
+    conn.execute("""
+      CREATE TRIGGER items_view_delete INSTEAD OF DELETE ON items BEGIN
+        DELETE FROM item_data WHERE id = old.id;
+      END
+    """)
+
+def create_item_data_triggers(conn):
+    # Keep items_fts and item_rollup in step with item_data
+    def names(row):
+        values = {c: f"{row}.{c}" for c in ("parts", "notes", "comments")}
+        for column, _, _ in ITEM_DICTIONARIES:
+            values[column] = dictionary_name(column, f"{row}.{column}_id")
+        values["day"] = plant_strftime_sql("%Y-%m-%d", f"{row}.created_ts")
+        return values
+
+    new, old = names("new"), names("old")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='items_fts'").fetchone():
+        cols = ", ".join(FTS_COLUMNS)
+        new_fts = ", ".join(new[c] for c in FTS_COLUMNS)
+        old_fts = ", ".join(old[c] for c in FTS_COLUMNS)
+        conn.execute(f"""
+          CREATE TRIGGER item_data_fts_insert AFTER INSERT ON item_data BEGIN
+            INSERT INTO items_fts (rowid, {cols}) VALUES (new.id, {new_fts});
+          END
+        """)
+        conn.execute(f"""
+          CREATE TRIGGER item_data_fts_delete AFTER DELETE ON item_data BEGIN
+            INSERT INTO items_fts (items_fts, rowid, {cols}) VALUES ('delete', old.id, {old_fts});
+          END
+        """)
+        conn.execute(f"""
+          CREATE TRIGGER item_data_fts_update AFTER UPDATE OF id, parts, reason_id, notes, comments ON item_data BEGIN
+            INSERT INTO items_fts (items_fts, rowid, {cols}) VALUES ('delete', old.id, {old_fts});
+            INSERT INTO items_fts (rowid, {cols}) VALUES (new.id, {new_fts});
+          END
+        """)
+
+    add = f"""
+        INSERT INTO item_rollup (day, line, shift, reason, n)
+        VALUES ({new["day"]}, {new["line"]}, {new["shift"]}, {new["reason"]}, 1)
+        ON CONFLICT (day, line, shift, reason) DO UPDATE SET n = n + 1;
+    """
+    key = f"""
+        day = {old["day"]} AND line = {old["line"]}
+        AND shift = {old["shift"]} AND reason = {old["reason"]}
+    """
+    remove = f"""
+        UPDATE item_rollup SET n = n - 1 WHERE {key};
+        DELETE FROM item_rollup WHERE {key} AND n <= 0;
+    """
+    conn.execute(f"CREATE TRIGGER item_data_rollup_insert AFTER INSERT ON item_data BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER item_data_rollup_delete AFTER DELETE ON item_data BEGIN {remove} END")
+    conn.execute(f"""
+      CREATE TRIGGER item_data_rollup_update
+      AFTER UPDATE OF created_ts, line_id, shift_id, reason_id ON item_data BEGIN {remove} {add} END
+    """)
+
+def legacy_epoch(text):
+    # Migration 11: None for unreadable times (restores never checked them)
+    try:
+        return plant_epoch(text)
+    except (TypeError, ValueError):
+        return None
+
+def migration_epoch_timestamps(conn):
+    # item_data.created_at (plant wall-clock text) becomes created_ts, UTC epoch
+    # seconds; the items view still has created_at, formatted in plant time
+    conn.execute("""
+      CREATE TABLE plant_offsets (
+        starts INTEGER PRIMARY KEY,
+        local_starts INTEGER NOT NULL,
+        utc_offset INTEGER NOT NULL,
+        zone TEXT NOT NULL
+      )
+    """)
+    conn.execute("CREATE INDEX idx_plant_offsets_local_starts ON plant_offsets(local_starts)")
+    fill_plant_offsets(conn)
+
+    conn.execute("DROP VIEW items")
+    conn.execute("""
+      CREATE TABLE item_data_new (
+        id INTEGER PRIMARY KEY,
+        parts TEXT NOT NULL,
+        line_id INTEGER NOT NULL REFERENCES lines (id),
+        reason_id INTEGER NOT NULL REFERENCES reasons (id),
+        sequence INTEGER NOT NULL,
+        shift_id INTEGER NOT NULL REFERENCES shifts (id),
+        created_ts INTEGER NOT NULL,
+        notes TEXT,
+        comments TEXT
+      )
+    """)
+    conn.create_function("legacy_epoch", 1, legacy_epoch, deterministic=True)
+    conn.execute("""
+      INSERT INTO item_data_new (id, parts, line_id, reason_id, sequence, shift_id, created_ts, notes, comments)
+      SELECT id, parts, line_id, reason_id, sequence, shift_id, COALESCE(legacy_epoch(created_at), 0), notes, comments
+      FROM item_data
+    """)
+    # Those become 0 (1970-01-01). Their original text is kept in
+    # legacy_created_at, so they can still be dated by hand.
+    conn.execute("""
+      CREATE TABLE legacy_created_at (
+        item_id INTEGER PRIMARY KEY,
+        created_at TEXT
+      )
+    """)
+    conn.execute("""
+      INSERT INTO legacy_created_at (item_id, created_at)
+      SELECT id, created_at FROM item_data WHERE legacy_epoch(created_at) IS NULL
+    """)
+    unreadable = conn.execute("SELECT item_id, created_at FROM legacy_created_at ORDER BY item_id").fetchall()
+    if unreadable:
+        shown = ", ".join(f"{r[0]}: {r[1]!r}" for r in unreadable[:20])
+        app.logger.warning(
+            "migration 11: %d entries had an unreadable created_at and are now dated 1970-01-01; "
+            "the original text is kept in legacy_created_at (%s%s)",
+            len(unreadable), shown, ", ..." if len(unreadable) > 20 else ""
+        )
+    # Takes the old indexes and triggers with it; items_fts keeps its contents
+    # (same ids and texts). The rollup is recounted, as rows whose time
+    # couldn't be read now count on 1970-01-01.
+    conn.execute("DROP TABLE item_data")
+    conn.execute("ALTER TABLE item_data_new RENAME TO item_data")
+    for name, columns in ITEM_DATA_TS_INDEXES.items():
+        conn.execute(f"CREATE INDEX {name} ON {columns}")
+    create_items_view(conn)
+    create_item_data_triggers(conn)
+    conn.execute("DELETE FROM item_rollup")
+    conn.execute(f"INSERT INTO item_rollup (day, line, shift, reason, n) {ROLLUP_SELECT}")
+
+def migration_archives(conn):
+    # Catalogue of the month files written by `flask archive`; first_ts/last_ts
+    # bound their entries so a query attaches only the months it reaches
+    conn.execute("""
+      CREATE TABLE archives (
+        month TEXT PRIMARY KEY,
+        items INTEGER NOT NULL,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        archived_at INTEGER NOT NULL
+      )
+    """)
+
+def migration_trigram_fts(conn):
+    # items_fts with the trigram tokenizer: a phrase MATCH is then a substring
+    # match, so FTS answers what the LIKE searches (and the archives) match
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='items_fts'").fetchone():
+        return
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        # SQLite before 3.34 has no trigram tokenizer: searches use LIKE (see init_db)
+        return
+    conn.execute("DROP TABLE temp.trigram_probe")
+    # The item_data triggers write to items_fts by name and pick up the new table
+    conn.execute("DROP TABLE items_fts")
+    conn.execute(f"""
+      CREATE VIRTUAL TABLE items_fts USING fts5(
+        {", ".join(FTS_COLUMNS)}, content='items', content_rowid='id', tokenize='trigram'
+      )
+    """)
+    conn.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+
+def migration_archive_ids(conn):
+    # Ids are never handed out twice: item_data becomes AUTOINCREMENT, seeded
+    # past every archived id, and the catalogue records each month's highest id
+    # so imports can keep clear of them (see restore_backup)
+    conn.execute("ALTER TABLE archives ADD COLUMN last_id INTEGER NOT NULL DEFAULT 0")
+    for r in conn.execute("SELECT month FROM archives").fetchall():
+        path = os.path.abspath(archive_path(r["month"]))
+        if not os.path.exists(path):
+            app.logger.warning("migration 14: archive file for %s is missing: %s", r["month"], path)
+            continue
+        # ATTACH can't run inside the migration's transaction
+        archive = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+        try:
+            last_id = archive.execute("SELECT COALESCE(MAX(id), 0) FROM item_data").fetchone()[0]
+        finally:
+            archive.close()
+        conn.execute("UPDATE archives SET last_id=? WHERE month=?", (last_id, r["month"]))
+
+    conn.execute("DROP VIEW items")
+    conn.execute("""
+      CREATE TABLE item_data_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parts TEXT NOT NULL,
+        line_id INTEGER NOT NULL REFERENCES lines (id),
+        reason_id INTEGER NOT NULL REFERENCES reasons (id),
+        sequence INTEGER NOT NULL,
+        shift_id INTEGER NOT NULL REFERENCES shifts (id),
+        created_ts INTEGER NOT NULL,
+        notes TEXT,
+        comments TEXT
+      )
+    """)
+    conn.execute("INSERT INTO item_data_new SELECT * FROM item_data")
+    # Same ids and values: items_fts and item_rollup stay as they are
+    conn.execute("DROP TABLE item_data")
+    conn.execute("ALTER TABLE item_data_new RENAME TO item_data")
+    for name, columns in ITEM_DATA_TS_INDEXES.items():
+        conn.execute(f"CREATE INDEX {name} ON {columns}")
+    create_items_view(conn)
+    create_item_data_triggers(conn)
+    conn.execute("""
+      INSERT INTO sqlite_sequence (name, seq)
+      SELECT 'item_data', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name='item_data')
+    """)
+    conn.execute("""
+      UPDATE sqlite_sequence
+      SET seq = MAX(seq, (SELECT COALESCE(MAX(last_id), 0) FROM archives))
+      WHERE name='item_data'
+    """)
+
+# Per plant-hour counts, as item_rollup has per day: hour and shift-day trends
+# read these, as a shift-day can start at any hour
+HOUR_ROLLUP_TABLE = """
+  CREATE TABLE IF NOT EXISTS item_rollup_hour (
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    shift TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (day, hour, line, shift, reason)
+  ) WITHOUT ROWID
+"""
+
+def hour_rollup_select(table="item_data"):
+    # Counted on the dictionary ids, names looked up once per group
+    return f"""
+      SELECT strftime('%Y-%m-%d', local_hour * 3600, 'unixepoch') AS day, local_hour % 24 AS hour,
+        {dictionary_name("line", "line_id")} AS line, {dictionary_name("shift", "shift_id")} AS shift,
+        {dictionary_name("reason", "reason_id")} AS reason, n
+      FROM (
+        SELECT (created_ts + {plant_offset_sql("created_ts")}) / 3600 AS local_hour,
+          line_id, shift_id, reason_id, COUNT(*) AS n
+        FROM {table}
+        GROUP BY 1, 2, 3, 4
+      )
+    """
+
+def create_hour_rollup_triggers(conn):
+    # Keep item_rollup_hour in step with item_data, as item_rollup is
+    def key(row):
+        values = {c: dictionary_name(c, f"{row}.{c}_id") for c, _, _ in ITEM_DICTIONARIES}
+        values["day"] = plant_strftime_sql("%Y-%m-%d", f"{row}.created_ts")
+        values["hour"] = f"CAST({plant_strftime_sql('%H', f'{row}.created_ts')} AS INTEGER)"
+        return values
+
+    new, old = key("new"), key("old")
+    add = f"""
+        INSERT INTO item_rollup_hour (day, hour, line, shift, reason, n)
+        VALUES ({new["day"]}, {new["hour"]}, {new["line"]}, {new["shift"]}, {new["reason"]}, 1)
+        ON CONFLICT (day, hour, line, shift, reason) DO UPDATE SET n = n + 1;
+    """
+    where = " AND ".join(f"{c} = {old[c]}" for c in ("day", "hour", "line", "shift", "reason"))
+    remove = f"""
+        UPDATE item_rollup_hour SET n = n - 1 WHERE {where};
+        DELETE FROM item_rollup_hour WHERE {where} AND n <= 0;
+    """
+    conn.execute(f"CREATE TRIGGER item_data_rollup_hour_insert AFTER INSERT ON item_data BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER item_data_rollup_hour_delete AFTER DELETE ON item_data BEGIN {remove} END")
+    conn.execute(f"""
+      CREATE TRIGGER item_data_rollup_hour_update
+      AFTER UPDATE OF created_ts, line_id, shift_id, reason_id ON item_data BEGIN {remove} {add} END
+    """)
+
+def migration_hour_rollup(conn):
+    conn.execute(HOUR_ROLLUP_TABLE)
+    conn.execute(f"INSERT INTO item_rollup_hour (day, hour, line, shift, reason, n) {hour_rollup_select()}")
+    create_hour_rollup_triggers(conn)
+    # The archived months get theirs on their own connections: ATTACH can't
+    # run inside the migration's transaction
+    for r in conn.execute("SELECT month FROM archives").fetchall():
+        path = os.path.abspath(archive_path(r["month"]))
+        if not os.path.exists(path):
+            app.logger.warning("migration 15: archive file for %s is missing: %s", r["month"], path)
+            continue
+        archive = sqlite3.connect(path)
+        try:
+            archive.execute(HOUR_ROLLUP_TABLE)
+            archive.execute("DELETE FROM item_rollup_hour")
+            archive.execute(f"INSERT INTO item_rollup_hour (day, hour, line, shift, reason, n) {hour_rollup_select()}")
+            archive.commit()
+        finally:
+            archive.close()
+
+def refill_rollups(conn):
+    # Both rollups recounted from the items, inside the caller's transaction
+    conn.execute("DELETE FROM item_rollup")
+    conn.execute(f"INSERT INTO item_rollup (day, line, shift, reason, n) {ROLLUP_SELECT}")
+    conn.execute("DELETE FROM item_rollup_hour")
+    conn.execute(f"INSERT INTO item_rollup_hour (day, hour, line, shift, reason, n) {hour_rollup_select()}")
+
+# Applied in order; PRAGMA user_version records how many have run.
+# Never edit or reorder an entry once released, only append new ones.
+MIGRATIONS = [
+    migration_base_schema,
+    migration_filter_indexes,
+    migration_fulltext,
+    migration_rollup,
+    migration_meta,
+    migration_changed_at,
+    migration_idempotency_keys,
+    migration_jobs,
+    migration_changes,
+    migration_dictionary_encoding,
+    migration_epoch_timestamps,
+    migration_archives,
+    migration_trigram_fts,
+    migration_archive_ids,
+    migration_hour_rollup,
+]
+
+# Request and SQL metrics for /metrics, kept per process: every request is
+# timed by route, split into phases (see phase()), and its SQL statements are
+# counted and timed by TimedConnection. Collection is a few dict updates under
+# a lock per request, plus one perf_counter pair per statement. Each gunicorn
+# worker reports only its own requests.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26)
+
+METRIC_HISTOGRAMS = {
+    "tracker_request_duration_seconds": ("Time to produce a response, by route.", DURATION_BUCKETS),
+    "tracker_request_phase_seconds": ("Time spent in each phase of a request.", DURATION_BUCKETS),
+    "tracker_request_sql_statements": ("SQL statements run per request.", COUNT_BUCKETS),
+    "tracker_request_sql_seconds": ("Time spent in SQL per request.", DURATION_BUCKETS),
+    "tracker_response_size_bytes": ("Response body size.", SIZE_BUCKETS),
+}
+METRIC_COUNTERS = {
+    "tracker_slow_queries_total": "Statements slower than SLOW_QUERY_MS.",
+}
+
+_histograms = {}
+_counters = {}
+_metrics_lock = threading.Lock()
+_request_stats = threading.local()
+
+def observe(name, labels, value):
+    # labels: tuple of (name, value) pairs. Bucket counts are stored
+    # per bucket and made cumulative when rendered.
+    buckets = METRIC_HISTOGRAMS[name][1]
+    index = bisect.bisect_left(buckets, value)
+    with _metrics_lock:
+        series = _histograms.get((name, labels))
+        if series is None:
+            series = _histograms[(name, labels)] = {"counts": [0] * (len(buckets) + 1), "sum": 0.0}
+        series["counts"][index] += 1
+        series["sum"] += value
+
+def increment(name, labels=()):
+    with _metrics_lock:
+        _counters[(name, labels)] = _counters.get((name, labels), 0) + 1
+
+@contextmanager
+def phase(name):
+    # Adds the block's wall time to the current request's phase totals
+    stats = getattr(_request_stats, "current", None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats["phases"][name] = stats["phases"].get(name, 0.0) + time.perf_counter() - start
+
+def log_slow_query(conn, sql, params, elapsed):
+    increment("tracker_slow_queries_total")
+    try:
+        plan = [r[3] for r in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)]
+    except (sqlite3.Error, ValueError):
+        plan = []
+    app.logger.warning(
+        "slow query: %.1f ms\n  sql: %s\n  params: %r\n  plan: %s",
+        elapsed * 1000, " ".join(sql.split()), params, "; ".join(plan) or "-"
+    )
+
+def record_sql(conn, sql, params, elapsed):
+    stats = getattr(_request_stats, "current", None)
+    if stats is not None:
+        stats["sql"] += 1
+        stats["sql_seconds"] += elapsed
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(conn, sql, params, elapsed)
+
+class TimedConnection(sqlite3.Connection):
+    # Times each statement up to its first row. Rows fetched afterwards aren't
+    # counted, but for the aggregates and LIMITed pages here that's most of it.
+    # Statements on the writer and checkpoint threads count towards no request.
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            record_sql(self, sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            # No EXPLAIN for a whole batch of parameters
+            record_sql(self, sql, None, time.perf_counter() - start)
+
+@app.before_request
+def start_request_stats():
+    _request_stats.current = {"start": time.perf_counter(), "sql": 0, "sql_seconds": 0.0, "phases": {}}
+
+def counted_body(chunks, route):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        observe("tracker_response_size_bytes", (("route", route),), size)
+
+@app.after_request
+def record_request_stats(response):
+    stats = getattr(_request_stats, "current", None)
+    if stats is None:
+        return response
+    _request_stats.current = None
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    by_route = (("route", route),)
+    # Streamed bodies (exports) are produced after this point, so their time
+    # isn't included; their size is recorded once they've been sent
+    observe(
+        "tracker_request_duration_seconds",
+        by_route + (("method", request.method), ("status", str(response.status_code))),
+        time.perf_counter() - stats["start"]
+    )
+    observe("tracker_request_sql_statements", by_route, stats["sql"])
+    observe("tracker_request_sql_seconds", by_route, stats["sql_seconds"])
+    for name, seconds in stats["phases"].items():
+        observe("tracker_request_phase_seconds", by_route + (("phase", name),), seconds)
+
+    if response.content_length is not None:
+        observe("tracker_response_size_bytes", by_route, response.content_length)
+    elif response.is_streamed and not response.direct_passthrough:
+        response.response = counted_body(response.iter_encoded(), route)
+    return response
+
+def prometheus_labels(labels, extra=()):
+    pairs = []
+    for k, v in labels + extra:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{k}="{v}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def render_metrics():
+    with _metrics_lock:
+        histograms = {k: {"counts": list(v["counts"]), "sum": v["sum"]} for k, v in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    for name, (help_text, buckets) in METRIC_HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            total = 0
+            for bound, n in zip(buckets + ("+Inf",), series["counts"]):
+                total += n
+                lines.append(f"{name}_bucket{prometheus_labels(labels, (('le', bound),))} {total}")
+            lines.append(f"{name}_sum{prometheus_labels(labels)} {series['sum']}")
+            lines.append(f"{name}_count{prometheus_labels(labels)} {total}")
+    for name, help_text in METRIC_COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        series = {labels: n for (counter, labels), n in counters.items() if counter == name} or {(): 0}
+        for labels, n in sorted(series.items()):
+            lines.append(f"{name}{prometheus_labels(labels)} {n}")
+    return "\n".join(lines) + "\n"
+
+# Set by init_db(): whether this database has the (trigram) items_fts index
+FTS_ENABLED = False
+
+def connect():
+    # busy timeout: wait for the write lock instead of failing with "database is locked"
+    # uri: archive months are attached read-only (see attach_archives)
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, factory=TimedConnection, uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT_PAGES}")
     return conn
 
+def migrate(conn):
+    # BEGIN IMMEDIATE so workers starting together run the migrations once
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+        sync_plant_zone(conn)
+        seeded = ensure_default_options(conn, "line", DEFAULT_LINE_OPTIONS)
+        seeded = ensure_default_options(conn, "shift", DEFAULT_SHIFT_OPTIONS) or seeded
+        # Only on a change, so a restart or a new worker keeps every ETag valid
+        if seeded or version < len(MIGRATIONS):
+            bump_versions(conn, "options")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def init_db():
+    global FTS_ENABLED
+    conn = connect()
+    try:
+        # Persistent, but can't change inside a transaction, so set before migrating.
+        # WAL lets readers (exports, dashboards) and the writer proceed in parallel.
+        conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        migrate(conn)
+        # Only a trigram index matches substrings the way LIKE does
+        FTS_ENABLED = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name='items_fts' AND sql LIKE '%trigram%'"
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+def checkpoint(conn, mode="PASSIVE"):
+    # Returns (busy, wal frames, frames checkpointed)
+    return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+def wal_size():
+    try:
+        return os.path.getsize(DB_PATH + "-wal")
+    except OSError:
+        return 0
+
+def run_checkpointer():
+    # Auto-checkpoints are PASSIVE and give up while readers are active, so a
+    # busy day of long exports can grow the WAL without bound. Past the
+    # threshold, TRUNCATE waits (up to the busy timeout) for readers to move on
+    # and resets the file to zero bytes.
+    conn = connect()
+    while True:
+        time.sleep(WAL_CHECKPOINT_INTERVAL)
+        try:
+            if wal_size() > WAL_TRUNCATE_BYTES:
+                checkpoint(conn, "TRUNCATE")
+            else:
+                checkpoint(conn)
+        except sqlite3.Error:
+            app.logger.exception("WAL checkpoint failed")
+
+_checkpointer = {"pid": None}
+_checkpointer_lock = threading.Lock()
+
+def start_checkpointer():
+    # One per process, started lazily so it runs in each gunicorn worker after fork
+    if WAL_CHECKPOINT_INTERVAL <= 0 or SQLITE_JOURNAL_MODE != "WAL":
+        return
+    with _checkpointer_lock:
+        if _checkpointer["pid"] == os.getpid():
+            return
+        _checkpointer["pid"] = os.getpid()
+        threading.Thread(target=run_checkpointer, name="wal-checkpoint", daemon=True).start()
+
+_local = threading.local()
+
+def db():
+    # One long-lived connection per thread, reopened after a fork (gunicorn --preload)
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        start_checkpointer()
+        conn = connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+@app.teardown_appcontext
+def release_db(exc):
+    # The connection stays open for the next request; never leak a transaction into it
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+# All item and option mutations go through one writer thread per process.
+# Writes that arrive within WRITE_BATCH_WINDOW_MS of each other share one
+# transaction, so many stations submitting at once pay for one commit (and
+# fsync) instead of queueing on the SQLite lock one by one. Across gunicorn
+# workers the writers still serialize on SQLite's lock and busy timeout.
+_write_queue = queue.Queue()
+_writer = {"pid": None}
+_writer_lock = threading.Lock()
+_claim_lock = threading.Lock()
+
+class WriteTimeout(Exception):
+    pass
+
+def claim_jobs(jobs):
+    # The jobs the writer will run: those whose caller hasn't given up (see submit_write)
+    with _claim_lock:
+        claimed = [job for job in jobs if not job.get("cancelled")]
+        for job in claimed:
+            job["started"] = True
+    return claimed
+
+def run_job(conn, job):
+    try:
+        job["result"] = job["fn"](conn)
+    except Exception as e:
+        job["error"] = e
+
+def commit_group(conn, jobs):
+    # Each job runs in its own savepoint: a failing job is rolled back and
+    # reported to its caller without taking the rest of the group with it
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for job in jobs:
+            conn.execute("SAVEPOINT job")
+            run_job(conn, job)
+            if "error" in job:
+                conn.execute("ROLLBACK TO job")
+            conn.execute("RELEASE job")
+        conn.commit()
+    except Exception as e:
+        # BEGIN or COMMIT failed: none of the group is durable
+        if conn.in_transaction:
+            conn.rollback()
+        for job in jobs:
+            job.pop("result", None)
+            job.setdefault("error", e)
+
+def run_writer():
+    conn = connect()
+    held = None
+    while True:
+        jobs = [held or _write_queue.get()]
+        held = None
+        try:
+            if jobs[0]["own_transaction"]:
+                if claim_jobs(jobs):
+                    run_job(conn, jobs[0])
+                continue
+
+            deadline = time.monotonic() + WRITE_BATCH_WINDOW_MS / 1000
+            while len(jobs) < WRITE_BATCH_MAX:
+                try:
+                    job = _write_queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job["own_transaction"]:
+                    # Runs on its own, right after this group
+                    held = job
+                    break
+                jobs.append(job)
+            claimed = claim_jobs(jobs)
+            if claimed:
+                commit_group(conn, claimed)
+        except Exception as e:
+            app.logger.exception("writer failed")
+            for job in jobs:
+                job.setdefault("error", e)
+        finally:
+            for job in jobs:
+                job["done"].set()
+
+def start_writer():
+    with _writer_lock:
+        if _writer["pid"] == os.getpid():
+            return
+        _writer["pid"] = os.getpid()
+        threading.Thread(target=run_writer, name="db-writer", daemon=True).start()
+
+def submit_write(fn, own_transaction=False):
+    # Run fn(conn) on the writer and return its result once the transaction
+    # holding it has committed. fn must not commit; raising rolls back only fn's
+    # work. own_transaction=True hands fn the connection outside any
+    # transaction, for operations that manage their own (restore_backup).
+    job = {"fn": fn, "own_transaction": own_transaction, "done": threading.Event()}
+
+    with phase("write"):
+        if not WRITE_QUEUE:
+            conn = db()
+            if own_transaction:
+                run_job(conn, job)
+            else:
+                commit_group(conn, [job])
+        else:
+            start_writer()
+            _write_queue.put(job)
+            # A write the writer hasn't started within WRITE_TIMEOUT (a long
+            # restore ahead of it, or a writer that died) is withdrawn, so
+            # it can't land after the caller was told it failed. One already
+            # started is waited for to the end, as its outcome is then settled.
+            if not job["done"].wait(WRITE_TIMEOUT):
+                with _claim_lock:
+                    if not job.get("started"):
+                        job["cancelled"] = True
+                if job.get("cancelled"):
+                    raise WriteTimeout(f"the write didn't start within {WRITE_TIMEOUT:g} s")
+                job["done"].wait()
+
+    if "error" in job:
+        raise job["error"]
+    return job.get("result")
+
+@app.errorhandler(WriteTimeout)
+def write_timeout(e):
+    app.logger.warning("write queue stalled: %s", e)
+    if request.path.startswith("/api/"):
+        response = jsonify(error=f"busy: {e}; try again")
+    else:
+        response = Response(f"Busy: {e}; try again.\n", mimetype="text/plain")
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
 def login_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -527,20 +2094,36 @@ def login_required(fn):
             return redirect(url_for("login"))
         return fn(*args, **kwargs)
     return wrapper
+
+def api_auth_required(fn):
+    # Logged-in browser session, or "Authorization: Bearer <API_TOKEN>"
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        auth = request.headers.get("Authorization", "")
+        token_ok = bool(API_TOKEN) and auth.startswith("Bearer ") and hmac.compare_digest(
+            auth[len("Bearer "):].encode("utf-8"), API_TOKEN.encode("utf-8")
+        )
+        if not (token_ok or session.get("logged_in")):
+            return jsonify(error="unauthorized"), 401
+        return fn(*args, **kwargs)
+    return wrapper
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         if request.form.get("password", "") == TRACKER_PASSWORD:
             session["logged_in"] = True
             return redirect("/")
-        return render_template_string(LOGIN_HTML, error="Wrong password")
-    return render_template_string(LOGIN_HTML, error=None)
+        return render_template("login.html", error="Wrong password")
+    return render_template("login.html", error=None)
 
 @app.get("/logout")
 def logout():
     session.clear()
     return redirect("/login")
 
+FILTER_ARGS = ("f_line", "f_shift", "q", "from", "to", "f_reason")
+
 def build_filters(args):
     return {
         "f_line": (args.get("f_line") or "").strip(),
@@ -551,81 +2134,711 @@ def build_filters(args):
         "f_reason": (args.get("f_reason") or "").strip(),
     }
 
-def apply_filters_sql(filters):
+def fts_query(text, column=None):
+    # The whole text as one trigram phrase: a case-insensitive substring match
+    # ("ratch" finds "scratch"), the same rows as LIKE '%text%'. Returns None
+    # when FTS can't express the search (under 3 characters, LIKE wildcards,
+    # no trigram index): use LIKE.
+    if not FTS_ENABLED or len(text) < 3 or "%" in text or "_" in text:
+        return None
+    phrase = '"' + text.replace('"', '""') + '"'
+    return f"{column} : {phrase}" if column else phrase
+
+def like_sql(column):
+    # Dictionary columns match against the few names, not the name of every row
+    tables = {c: t for c, t, _ in ITEM_DICTIONARIES}
+    if column in tables:
+        return f"{column}_id IN (SELECT id FROM {tables[column]} WHERE name LIKE ?)"
+    return f"{column} LIKE ?"
+
+def apply_filters_sql(filters, fts=True):
+    # fts=False: LIKE for the text filters (archived months have no items_fts)
     where = []
     params = []
 
     if filters["f_line"]:
-        where.append("line = ?")
+        where.append(f"line_id = {dictionary_id('line', '?')}")
         params.append(filters["f_line"])
 
     if filters["f_shift"]:
-        where.append("shift = ?")
+        where.append(f"shift_id = {dictionary_id('shift', '?')}")
         params.append(filters["f_shift"])
 
     if filters["q"]:
-        where.append("(parts LIKE ? OR reason LIKE ?)")
-        like = f"%{filters['q']}%"
-        params.extend([like, like])
+        match = fts_query(filters["q"]) if fts else None
+        if match:
+            where.append("id IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)")
+            params.append(match)
+        else:
+            like = f"%{filters['q']}%"
+            where.append("(" + " OR ".join(like_sql(c) for c in FTS_COLUMNS) + ")")
+            params.extend([like] * len(FTS_COLUMNS))
 
     if filters["f_reason"]:
-        where.append("reason LIKE ?")
-        params.append(f"%{filters['f_reason']}%")
+        match = fts_query(filters["f_reason"], column="reason") if fts else None
+        if match:
+            where.append("id IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)")
+            params.append(match)
+        else:
+            where.append(like_sql("reason"))
+            params.append(f"%{filters['f_reason']}%")
+
+    # Plant days become a half-open range of epoch seconds on created_ts.
+    # Always bound both ends: the planner only trusts a created_ts index for a closed range.
+    if filters["from_"] or filters["to_"]:
+        where.append("created_ts >= ? AND created_ts < ?")
+        params.extend(day_range(filters["from_"], filters["to_"]))
+
+    clause = ("WHERE " + " AND ".join(where)) if where else ""
+    return clause, params
+
+def day_range(from_, to_):
+    # A missing or unreadable end leaves that side open
+    try:
+        start = plant_midnight(from_)
+    except (ValueError, OverflowError):
+        start = EARLIEST
+    try:
+        end = plant_midnight((parse_day(to_) + timedelta(days=1)).isoformat())
+    except (ValueError, OverflowError):
+        end = -EARLIEST
+    return start, end
+
+def and_where(clause, cond):
+    return f"{clause} AND {cond}" if clause else f"WHERE {cond}"
+
+def archive_path(month):
+    return os.path.join(ARCHIVE_DIR, f"items-{month}.db")
+
+def archive_schema(month):
+    return "archive_" + month.replace("-", "_")
+
+def archive_source(month):
+    # The month's entries shaped like items. Names and plant times come from
+    # the main database's dictionaries and offsets; ids never change there.
+    return f"(SELECT {item_columns_sql()} FROM {archive_schema(month)}.item_data)"
+
+def archived_months(conn, filters):
+    # Only a date range reaches into the archives; without one, live entries
+    # only. filters=None: every archived month, as backups read.
+    if filters is None:
+        return [r["month"] for r in conn.execute("SELECT month FROM archives ORDER BY month")]
+    if not (filters["from_"] or filters["to_"]):
+        return []
+    start, end = day_range(filters["from_"], filters["to_"])
+    rows = conn.execute(
+        "SELECT month FROM archives WHERE first_ts < ? AND last_ts >= ? ORDER BY month",
+        (end, start)
+    ).fetchall()
+    return [r["month"] for r in rows]
+
+def archive_parts(conn, filters):
+    # (month, clause, params) for each archived month the filters reach, oldest first
+    clause, params = apply_filters_sql(filters, fts=False) if filters is not None else ("", [])
+    return [(month, clause, params) for month in archived_months(conn, filters)]
+
+def archive_file(month):
+    # Absolute path of an archived month's file; ValueError when it's gone
+    path = os.path.abspath(archive_path(month))
+    if not os.path.exists(path):
+        raise ValueError(f"archive file for {month} is missing: {path}")
+    return path
+
+def attach_archives(conn, months):
+    # Attach exactly these months (read-only) and detach any others
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(months) > limit:
+        raise ValueError(
+            f"the date range reaches {len(months)} archived months; at most {limit} can be read at once"
+        )
+    wanted = {archive_schema(m): m for m in months}
+    attached = {r["name"] for r in conn.execute("PRAGMA database_list")}
+    for name in attached - set(wanted):
+        if name.startswith("archive_"):
+            conn.execute(f"DETACH DATABASE {name}")
+    for name, month in wanted.items():
+        if name in attached:
+            continue
+        conn.execute(f"ATTACH DATABASE ? AS {name}", (f"file:{quote(archive_file(month))}?mode=ro",))
+
+def archived_month_of(conn, item_id):
+    # The archived month holding this entry, or None; one file attached at a time
+    months = conn.execute(
+        "SELECT month FROM archives WHERE last_id >= ? ORDER BY month", (item_id,)
+    ).fetchall()
+    try:
+        for r in months:
+            attach_archives(conn, [r["month"]])
+            if conn.execute(
+                f"SELECT 1 FROM {archive_schema(r['month'])}.item_data WHERE id=?", (item_id,)
+            ).fetchone():
+                return r["month"]
+        return None
+    finally:
+        attach_archives(conn, [])
 
-    # created_at stored as "YYYY-MM-DD HH:MM:SS" so date filtering works with LIKE/range
-    if filters["from_"]:
-        where.append("created_at >= ?")
-        params.append(filters["from_"] + " 00:00:00")
+def open_archive_readers(conn):
+    # (last_id, read-only connection) per catalogued month, for looking ids up
+    # from inside a transaction, where ATTACH isn't allowed. Close them after.
+    readers = []
+    try:
+        for r in conn.execute("SELECT month, last_id FROM archives ORDER BY month").fetchall():
+            path = os.path.abspath(archive_path(r["month"]))
+            if not os.path.exists(path):
+                raise ValueError(f"archive file for {r['month']} is missing: {path}")
+            readers.append((r["last_id"], sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)))
+    except Exception:
+        for _, reader in readers:
+            reader.close()
+        raise
+    return readers
 
-    if filters["to_"]:
-        where.append("created_at <= ?")
-        params.append(filters["to_"] + " 23:59:59")
+def archived_ids(readers, ids):
+    # Which of ids are in the archive files (readers from open_archive_readers)
+    found = set()
+    for last_id, reader in readers:
+        wanted = [i for i in ids if i <= last_id]
+        if wanted:
+            found.update(r[0] for r in reader.execute(
+                f"SELECT id FROM item_data WHERE id IN ({','.join('?' * len(wanted))})", wanted
+            ))
+    return found
+
+def set_aside_archives(months, reason):
+    # Move month files out of the way under ARCHIVE_DIR/<reason>-<time>/. Never
+    # deleted: they may hold the only copy of those entries.
+    folder = os.path.join(ARCHIVE_DIR, f"{reason}-{int(time.time())}")
+    for month in months:
+        path = archive_path(month)
+        if os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+            os.replace(path, os.path.join(folder, os.path.basename(path)))
+    return folder
+
+def item_queries(conn, filters):
+    # [(months, source, clause, params)] for reading the filtered entries: items
+    # alone, or items plus the archived months in range. The months come in
+    # groups few enough to attach at once (see each_query); callers combine
+    # what each query reads. Each item_data is filtered on its own side of the
+    # UNION, so the created_ts and dictionary filters stay on indexes, and the
+    # items columns go on top: names and times are only worked out for the
+    # rows and columns a query uses, as with the view.
+    # Raises ValueError when an archive file is missing.
+    clause, params = apply_filters_sql(filters)
+    parts = archive_parts(conn, filters)
+    if not parts:
+        return [([], "items", clause, params)]
+    for month, _, _ in parts:
+        archive_file(month)
+    size = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    queries = []
+    for i in range(0, len(parts), size):
+        group = parts[i:i + size]
+        selects = [] if i else [f"SELECT * FROM main.item_data {clause}"]
+        group_params = [] if i else list(params)
+        for month, archive_clause, archive_params in group:
+            selects.append(f"SELECT * FROM {archive_schema(month)}.item_data {archive_clause}")
+            group_params += archive_params
+        source = f"(SELECT {item_columns_sql()} FROM ({' UNION ALL '.join(selects)}))"
+        queries.append(([month for month, _, _ in group], source, "", group_params))
+    return queries
+
+def each_query(conn, queries):
+    # (source, clause, params) of each query from item_queries() or
+    # rollup_queries(), with its months attached in turn: read each one before
+    # moving on to the next
+    for months, source, clause, params in queries:
+        if months:
+            attach_archives(conn, months)
+        yield source, clause, params
+
+def filter_query(filters):
+    # Inverse of build_filters: the non-empty filters as query-string arguments
+    names = {"from_": "from", "to_": "to"}
+    return {names.get(k, k): v for k, v in filters.items() if v}
+
+def page_args(args):
+    def cursor(name):
+        value = (args.get(name) or "").strip()
+        return int(value) if value.isdigit() else None
+
+    per_page = cursor("per_page") or PAGE_SIZE
+    return {
+        "before": cursor("before"),
+        "after": cursor("after"),
+        "per_page": min(per_page, MAX_PAGE_SIZE),
+    }
+
+ITEM_FIELDS = ("id", "created_at", "parts", "line", "reason", "sequence", "shift", "notes", "comments")
+
+def fetch_page(conn, clause, params, page, fields=ITEM_FIELDS, source="items", queries=None):
+    # Keyset pagination on id: "before" walks to older entries, "after" to newer
+    # ones. queries (from item_queries()) replaces source/clause/params: each
+    # gives its own first rows past the cursor, merged on id.
+    per_page = page["per_page"]
+    columns = ", ".join(dict.fromkeys(("id",) + tuple(fields)))
+    queries = queries or [([], source, clause, params)]
+
+    def select(condition, args, order):
+        rows = []
+        for q_source, q_clause, q_params in each_query(conn, queries):
+            rows += conn.execute(
+                f"SELECT {columns} FROM {q_source} {and_where(q_clause, condition) if condition else q_clause} "
+                f"ORDER BY id {order} LIMIT ?",
+                q_params + args + [per_page + 1]
+            ).fetchall()
+        if len(queries) > 1:
+            rows.sort(key=lambda r: r["id"], reverse=order == "DESC")
+        return rows[:per_page + 1]
+
+    if page["after"] is not None:
+        rows = select("id > ?", [page["after"]], "ASC")
+        if rows:
+            has_newer = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            return {
+                "rows": rows,
+                "per_page": per_page,
+                "newer": rows[0]["id"] if has_newer else None,
+                "older": rows[-1]["id"],
+            }
+        # Nothing newer left (e.g. deleted since): fall back to the first page
+        page = dict(page, after=None, before=None)
+
+    if page["before"] is not None:
+        rows = select("id < ?", [page["before"]], "DESC")
+    else:
+        rows = select("", [], "DESC")
+
+    has_older = len(rows) > per_page
+    rows = rows[:per_page]
+    return {
+        "rows": rows,
+        "per_page": per_page,
+        "newer": rows[0]["id"] if rows and page["before"] is not None else None,
+        "older": rows[-1]["id"] if has_older else None,
+    }
+
+def rollup_filters_sql(filters):
+    # item_rollup answers line/shift/whole-day filters; text searches need the raw rows
+    if filters["q"] or filters["f_reason"]:
+        return None
+    for day in (filters["from_"], filters["to_"]):
+        if day:
+            try:
+                parse_day(day)
+            except ValueError:
+                return None
+
+    where = []
+    params = []
+    if filters["f_line"]:
+        where.append("line = ?")
+        params.append(filters["f_line"])
+    if filters["f_shift"]:
+        where.append("shift = ?")
+        params.append(filters["f_shift"])
+    if filters["from_"] or filters["to_"]:
+        where.append("day >= ? AND day <= ?")
+        params.append(filters["from_"] or "0000-01-01")
+        params.append(filters["to_"] or "9999-12-31")
 
     clause = ("WHERE " + " AND ".join(where)) if where else ""
     return clause, params
 
-def totals_for(rows):
-    by_line = {}
-    by_shift = {}
-    by_reason = {}
+def rollup_queries(filters, queries, table="item_rollup"):
+    # [(months, source, clause, params)] over a rollup (item_rollup or
+    # item_rollup_hour) for filters it can answer, or None: the same groups as
+    # queries (from item_queries()), each archived month read from its own rollup
+    rollup = rollup_filters_sql(filters)
+    if not rollup:
+        return None
+    clause, params = rollup
+    result = []
+    for i, (months, _, _, _) in enumerate(queries):
+        if not months:
+            result.append(([], table, clause, params))
+            continue
+        selects = [] if i else [f"SELECT * FROM {table} {clause}"]
+        selects += [f"SELECT * FROM {archive_schema(m)}.{table} {clause}" for m in months]
+        result.append((months, "(" + " UNION ALL ".join(selects) + ")", "", params * len(selects)))
+    return result
+
+def filtered_totals(conn, filters, queries):
+    # totals_for() from item_rollup (and the archived months' rollups) when the
+    # filters allow it, or the items of queries (from item_queries()), added up
+    # over the queries, plus the overall count
+    rollup = rollup_queries(filters, queries)
+    # Over several queries every reason is counted, and the top 20 picked after
+    top = 20 if len(queries) == 1 else -1
+    if rollup:
+        parts = [
+            totals_for(conn, clause, params, source=source, count="SUM(n)", top_reasons=top)
+            for source, clause, params in each_query(conn, rollup)
+        ]
+    else:
+        parts = [
+            totals_for(conn, clause, params, source, top_reasons=top)
+            for source, clause, params in each_query(conn, queries)
+        ]
+    t = merge_totals(parts)
+    t["total"] = conn.execute(
+        "SELECT (SELECT COALESCE(SUM(n), 0) FROM item_rollup) + (SELECT COALESCE(SUM(items), 0) FROM archives)"
+    ).fetchone()[0]
+    return t
+
+def merge_totals(parts):
+    # totals_for() results over disjoint sets of entries, as one
+    if len(parts) == 1:
+        return parts[0]
+    sums = {"by_line": {}, "by_shift": {}, "by_reason": {}}
+    for t in parts:
+        for key, counts in sums.items():
+            for label, n in t[key]:
+                counts[label] = counts.get(label, 0) + n
+    merged = {key: sorted(counts.items(), key=lambda x: (-x[1], x[0])) for key, counts in sums.items()}
+    merged["by_reason"] = merged["by_reason"][:20]
+    merged["shown"] = sum(n for _, n in merged["by_shift"])
+    return merged
+
+def totals_for(conn, clause, params, source="items", count="COUNT(*)", top_reasons=20):
+    # One statement, one scan per grouping; SQLite has no GROUPING SETS.
+    # source/count let the same query run against item_rollup with SUM(n).
+    # top_reasons=-1 returns every reason.
+    # items (or items with archives) groups on the dictionary ids and looks up
+    # one name per group.
+    if "item_rollup" not in source:
+        key = {c: f"{c}_id" for c, _, _ in ITEM_DICTIONARIES}
+        label = {c: dictionary_name(c, f"{c}_id") for c, _, _ in ITEM_DICTIONARIES}
+    else:
+        key = label = {c: c for c, _, _ in ITEM_DICTIONARIES}
+    rows = conn.execute(
+        f"""
+        SELECT 'line' AS dim, {label["line"]} AS label, {count} AS n FROM {source} {clause} GROUP BY {key["line"]}
+        UNION ALL
+        SELECT 'shift', {label["shift"]}, {count} FROM {source} {clause} GROUP BY {key["shift"]}
+        UNION ALL
+        SELECT * FROM (
+          SELECT 'reason', {label["reason"]} AS label, {count} AS n FROM {source} {clause}
+          GROUP BY {key["reason"]} ORDER BY n DESC, label ASC LIMIT {int(top_reasons)}
+        )
+        """,
+        params * 3
+    ).fetchall()
 
+    groups = {"line": [], "shift": [], "reason": []}
     for r in rows:
-        by_line[r["line"]] = by_line.get(r["line"], 0) + 1
-        by_shift[r["shift"]] = by_shift.get(r["shift"], 0) + 1
-        by_reason[r["reason"]] = by_reason.get(r["reason"], 0) + 1
+        groups[r["dim"]].append((r["label"], r["n"]))
 
-    def sort_dict(d):
-        return sorted(d.items(), key=lambda x: (-x[1], x[0]))
+    def sort_counts(pairs):
+        return sorted(pairs, key=lambda x: (-x[1], x[0]))
 
     return {
-        "by_line": sort_dict(by_line),
-        "by_shift": sort_dict(by_shift),
-        "by_reason": sort_dict(by_reason)[:20],  # top 20 reasons
+        "shown": sum(n for _, n in groups["shift"]),
+        "by_line": sort_counts(groups["line"]),
+        "by_shift": sort_counts(groups["shift"]),
+        "by_reason": sort_counts(groups["reason"]),  # top 20 reasons (see top_reasons)
     }
 
+def make_bar_data(counts):
+    counts = [(name, val) for name, val in counts if name]
+    max_val = max((val for _, val in counts), default=1)
+
+    return [
+        {
+            "label": name,
+            "value": val,
+            "percent": int((val / max_val) * 100),
+        }
+        for name, val in sorted(counts)
+    ]
+
+def totals_fragment(conn, filters):
+    # Totals and charts cover the whole filtered set, not just the current page.
+    # Cached per filter set; the /events feed reuses the same renders.
+    def build():
+        try:
+            queries = item_queries(conn, filters)
+        except ValueError:
+            # A missing archive file: home() says so; live entries only
+            queries = [([], "items") + apply_filters_sql(filters)]
+        t = filtered_totals(conn, filters, queries)
+        return {
+            "total": t["total"],
+            "shown": t["shown"],
+            "html": Markup(render_template("totals.html", totals=t)),
+            "bars_html": Markup(render_template(
+                "bars.html",
+                line_bars=make_bar_data(t["by_line"]),
+                shift_bars=make_bar_data(t["by_shift"])
+            )),
+        }
+
+    return cached_fragment("totals", tuple(sorted(filters.items())), build)
+
+# Scrap counts per time bucket. Buckets come from a rollup when the filters
+# allow it: week and month from item_rollup, hour and shift-day from
+# item_rollup_hour, as shift-days start at SHIFT_DAY_START_HOUR, which
+# calendar-day rows can't split (a 12-month range is at most a few hundred
+# thousand rollup rows, whatever the item count). Text searches need one
+# grouped pass over the filtered items, on the dictionary ids. Rows are first
+# summed per day (per hour for "hour") and shift, so the bucket expression
+# runs once per day.
+TREND_BUCKETS = {
+    # name: (bucket expression over the day/shift sums, rollup,
+    #        default days, max days, moving-average window)
+    "hour": ("day", "item_rollup_hour", 7, 92, 24),
+    "shift_day": ("day || ' ' || shift", "item_rollup_hour", 30, 731, 6),
+    "week": ("date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER) + 6) % 7) || ' days')", "item_rollup", 182, 3660, 4),
+    "month": ("substr(day, 1, 7)", "item_rollup", 365, 3660, 3),
+}
+TREND_GROUPS = ("line", "shift", "reason", "none")
+
+def trend_range(filters, bucket):
+    # The filter's dates, or the bucket's default span ending today
+    _, _, default_days, max_days, _ = TREND_BUCKETS[bucket]
+    try:
+        end = parse_day(filters["to_"]) if filters["to_"] else plant_today()
+        start = parse_day(filters["from_"]) if filters["from_"] else end - timedelta(days=default_days - 1)
+    except ValueError:
+        raise ValueError("from and to must be YYYY-MM-DD dates")
+    if start > end:
+        raise ValueError("from is after to")
+    if (end - start).days >= max_days:
+        raise ValueError(f"{bucket} trends cover at most {max_days} days")
+    return start, end
+
+def trend_labels(bucket, start, end, shifts):
+    # Every bucket in the range, so empty ones show up as zeros
+    labels = []
+    if bucket == "week":
+        day = start - timedelta(days=start.weekday())
+        while day <= end:
+            labels.append(day.isoformat())
+            day += timedelta(days=7)
+    elif bucket == "month":
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            labels.append(f"{year}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    else:
+        day = start
+        while day <= end:
+            if bucket == "hour":
+                labels.extend(f"{day} {hour:02d}" for hour in range(24))
+            else:
+                labels.extend(f"{day} {shift}" for shift in shifts)
+            day += timedelta(days=1)
+    return labels
+
+def moving_averages(rows, window):
+    # Trailing mean over up to `window` buckets (fewer at the start) of each row
+    if numpy is not None and rows:
+        data = numpy.asarray(rows, dtype=float)
+        sums = numpy.cumsum(data, axis=1)
+        sums[:, window:] = sums[:, window:] - sums[:, :-window]
+        sizes = numpy.minimum(numpy.arange(1, data.shape[1] + 1), window)
+        return numpy.round(sums / sizes, 2).tolist()
+
+    averages = []
+    for values in rows:
+        running = 0
+        row = []
+        for i, v in enumerate(values):
+            running += v - (values[i - window] if i >= window else 0)
+            row.append(round(running / min(i + 1, window), 2))
+        averages.append(row)
+    return averages
+
+def compute_trends(conn, filters, bucket="month", group="line", window=None):
+    start, end = trend_range(filters, bucket)
+    filters = dict(filters, from_=start.isoformat(), to_=end.isoformat())
+    expression, rollup_table, _, _, default_window = TREND_BUCKETS[bucket]
+    window = window or default_window
+    series = "'all'" if group == "none" else group
+    day_start = SHIFT_DAY_START_HOUR * 3600 if bucket == "shift_day" else 0
+    if day_start:
+        # The last day's night shift runs into the next morning; what falls
+        # outside the range's shift-days is left out with the labels below
+        query_filters = dict(filters, to_=(end + timedelta(days=1)).isoformat())
+    else:
+        query_filters = filters
+
+    queries = item_queries(conn, query_filters)
+    rollup = rollup_queries(query_filters, queries, rollup_table)
+    label = (rollup_table if rollup else "items") + ("+archives" if queries[0][0] else "")
+    if rollup:
+        queries = rollup
+        # item_rollup_hour rows to plant hours, or to the shift-day they fall in
+        day = {
+            "hour": "day || ' ' || printf('%02d', hour)",
+            "shift_day": f"CASE WHEN hour < {SHIFT_DAY_START_HOUR} THEN date(day, '-1 day') ELSE day END",
+        }.get(bucket, "day")
+
+        def days(source, clause):
+            return f"SELECT {day} AS day, shift, {series} AS series, SUM(n) AS n FROM {source} {clause} GROUP BY 1, 2, 3"
+    else:
+        # Plant day (or hour, or shift-day) numbers in integer arithmetic,
+        # grouped on the dictionary ids; days and names worked out once per group
+        offset = plant_offset_case_sql("created_ts", *day_range(query_filters["from_"], query_filters["to_"]))
+        unit, fmt = (3600, "%Y-%m-%d %H") if bucket == "hour" else (86400, "%Y-%m-%d")
+        series_id, series_name = ("'all'", "series_id") if group == "none" else \
+            (f"{group}_id", dictionary_name(group, "series_id"))
+
+        def days(source, clause):
+            return f"""
+              SELECT strftime('{fmt}', local * {unit}, 'unixepoch') AS day,
+                {dictionary_name("shift", "shift_id")} AS shift, {series_name} AS series, n
+              FROM (
+                SELECT (created_ts + {offset} - {day_start}) / {unit} AS local, shift_id, {series_id} AS series_id,
+                  COUNT(*) AS n
+                FROM {source} {clause}
+                GROUP BY 1, 2, 3
+              )
+            """
+
+    # Summed over the queries (archived months come in groups, see item_queries)
+    counts = {}
+    for source, clause, params in each_query(conn, queries):
+        rows = conn.execute(
+            f"SELECT {expression} AS bucket, series, SUM(n) AS n FROM ({days(source, clause)}) GROUP BY 1, 2",
+            params
+        ).fetchall()
+        for r in rows:
+            series_counts = counts.setdefault(r["series"], {})
+            series_counts[r["bucket"]] = series_counts.get(r["bucket"], 0) + r["n"]
+    shifts = sorted(set(get_options(conn, "shift")) | {b.split(" ", 1)[1] for c in counts.values() for b in c}) \
+        if bucket == "shift_day" else []
+    labels = trend_labels(bucket, start, end, shifts)
+
+    keys = sorted(counts)
+    matrix = [[counts[k].get(label, 0) for label in labels] for k in keys]
+    total = [sum(column) for column in zip(*matrix)] if matrix else [0] * len(labels)
+    averages = moving_averages(matrix + [total], window)
+    return {
+        "bucket": bucket,
+        "group": group,
+        "from": filters["from_"],
+        "to": filters["to_"],
+        "window": window,
+        "source": label,
+        "buckets": labels,
+        "series": [
+            {"key": k, "counts": values, "moving_average": avg}
+            for k, values, avg in zip(keys, matrix, averages)
+        ],
+        "total": {"counts": total, "moving_average": averages[-1]},
+    }
+
+def trend_chart(trends):
+    # SVG geometry for the dashboard panel: total bars with the moving average
+    # as a line, and one sparkline of each series' moving average
+    n = len(trends["buckets"])
+    width, height = max(n, 1) * 10, 100
+    peak = max(trends["total"]["counts"] + trends["total"]["moving_average"] + [1])
+
+    def points(values, top):
+        return " ".join(f"{i * 10 + 5},{height - v / top * (height - 4):.1f}" for i, v in enumerate(values))
+
+    return {
+        "width": width,
+        "height": height,
+        "bars": [
+            {"x": i * 10 + 1, "h": round(v / peak * (height - 4), 1), "label": label, "n": v}
+            for i, (label, v) in enumerate(zip(trends["buckets"], trends["total"]["counts"]))
+        ],
+        "line": points(trends["total"]["moving_average"], peak),
+        "series": [
+            {
+                "key": s["key"],
+                "sum": sum(s["counts"]),
+                "last": s["moving_average"][-1] if s["moving_average"] else 0,
+                "line": points(s["moving_average"], max(s["moving_average"] + [1])),
+            }
+            for s in sorted(trends["series"], key=lambda s: -sum(s["counts"]))
+        ],
+        "first": trends["buckets"][0] if n else "",
+        "last": trends["buckets"][-1] if n else "",
+    }
+
+TREND_LABELS = {"hour": "Hour", "shift_day": "Shift-day", "week": "Week", "month": "Month"}
+
+def trends_fragment(conn, filters, bucket):
+    # The dashboard panel, per line; cached with the totals, and per day
+    # because the default range ends today
+    bucket = bucket if bucket in TREND_BUCKETS else "month"
+
+    def build():
+        context = {
+            "bucket": bucket,
+            "bucket_label": "shift" if bucket == "shift_day" else bucket,
+            "group_label": "Line",
+            "trend_links": [
+                (name, label, url_for("home", trend=name, **filter_query(filters)))
+                for name, label in TREND_LABELS.items()
+            ],
+        }
+        try:
+            trends = compute_trends(conn, filters, bucket, "line")
+        except ValueError as e:
+            return Markup(render_template("trends.html", error=str(e), **context))
+        return Markup(render_template(
+            "trends.html", chart=trend_chart(trends), window=trends["window"], **context
+        ))
+
+    key = ("trends", bucket, plant_today()) + tuple(sorted(filters.items()))
+    return cached_fragment("totals", key, build)
+
 @app.get("/")
 @login_required
 def home():
-    conn = db()
-    line_options = get_options(conn, "line")
-    shift_options = get_options(conn, "shift")
+    with phase("db"):
+        conn = db()
 
     filters = build_filters(request.args)
-    clause, params = apply_filters_sql(filters)
+    with phase("archives"):
+        try:
+            queries = item_queries(conn, filters)
+        except ValueError as e:
+            flash(f"{e}; showing live entries only", "error")
+            queries = [([], "items") + apply_filters_sql(filters)]
+
+    # A pending flash message makes this render one-off: no validators for it
+    flashes = "_flashes" in session
+    if not flashes:
+        with phase("validators"):
+            # Trends default to a range ending today
+            not_modified, etag, last_modified = conditional_get(conn, plant_today())
+        if not_modified:
+            return not_modified
 
-    # Total count (all)
-    total_all = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    with phase("options"):
+        line_options, shift_options = option_lists(conn)
 
-    # Filtered rows
-    rows = conn.execute(
-        f"""
-        SELECT id, parts, line, reason, sequence, shift, created_at, notes, comments
-        FROM items
-        {clause}
-        ORDER BY id DESC
-        """,
-        params
-    ).fetchall()
+    with phase("totals"):
+        summary = totals_fragment(conn, filters)
+    with phase("trends"):
+        trends = trends_fragment(conn, filters, request.args.get("trend"))
+    with phase("render"):
+        dropdowns = cached_fragment(
+            "dropdowns",
+            (tuple(line_options), tuple(shift_options)),
+            lambda: Markup(render_template(
+                "dropdowns.html", line_options=line_options, shift_options=shift_options
+            ))
+        )
+
+    with phase("query"):
+        page = fetch_page(conn, None, None, page_args(request.args), queries=queries)
+        # Where this render's /events stream picks up
+        events_since = conn.execute("SELECT COALESCE(MAX(id), 0) FROM changes").fetchone()[0]
+        # Archived rows are kept for audits: shown without a delete button
+        live = None
+        if queries[0][0] and page["rows"]:
+            ids = [r["id"] for r in page["rows"]]
+            live = {r[0] for r in conn.execute(
+                f"SELECT id FROM item_data WHERE id IN ({','.join('?' * len(ids))})", ids
+            )}
 
     items = [{
         "id": r["id"],
@@ -637,32 +2850,39 @@ def home():
         "created_at": r["created_at"],
         "notes": r["notes"],
         "comments": r["comments"],
-    } for r in rows]
-
-    line_bars = make_bar_data(items, "line")
-    shift_bars = make_bar_data(items, "shift")
-    
-    t = totals_for(rows)
-    totals = {
-        "total": total_all,
-        "shown": len(rows),
-        "by_line": t["by_line"],
-        "by_shift": t["by_shift"],
-        "by_reason": t["by_reason"],
-    }
+        "archived": live is not None and r["id"] not in live,
+    } for r in page["rows"]]
 
-    conn.close()
+    query = filter_query(filters)
+    if page["per_page"] != PAGE_SIZE:
+        query["per_page"] = page["per_page"]
+    pager = {
+        "newer": url_for("home", after=page["newer"], **query) if page["newer"] else None,
+        "older": url_for("home", before=page["older"], **query) if page["older"] else None,
+        "first": url_for("home", **query) if page["newer"] else None,
+    }
 
-    return render_template_string(
-        APP_HTML,
-        items=items,
-        line_options=line_options,
-        shift_options=shift_options,
-        filters=filters,
-        totals=totals,
-        line_bars=line_bars,
-        shift_bars=shift_bars
-    )
+    with phase("render"):
+        response = make_response(render_template(
+            "app.html",
+            items=items,
+            line_options=line_options,
+            shift_options=shift_options,
+            filters=filters,
+            totals={"total": summary["total"], "shown": summary["shown"]},
+            fragments={
+                "totals": summary["html"],
+                "trends": trends,
+                "bars": summary["bars_html"],
+                "dropdowns": dropdowns,
+            },
+            pager=pager,
+            job_filters=filter_query(filters),
+            events_since=events_since
+        ))
+    if not flashes:
+        with_validators(response, etag, last_modified)
+    return response
 
 @app.post("/add")
 @login_required
@@ -675,27 +2895,36 @@ def add():
     notes = (request.form.get("notes") or "").strip() or None
     comments = (request.form.get("comments") or "").strip() or None
 
-    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    created_ts = int(time.time())
 
-    conn = db()
-    conn.execute(
-        """
-        INSERT INTO items (parts, line, reason, sequence, shift, created_at, notes, comments)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (parts, line, reason, sequence, shift, created_at, notes, comments),
-    )
-    conn.commit()
-    conn.close()
+    def write(conn):
+        item_id = insert_item(
+            conn, (None, parts, line, reason, sequence, shift, created_ts, notes, comments)
+        )
+        bump_versions(conn, "items")
+        publish_changes(conn, "add", [item_id])
+
+    submit_write(write)
     return redirect("/")
 
 @app.post("/delete/<int:item_id>")
 @login_required
 def delete(item_id):
-    conn = db()
-    conn.execute("DELETE FROM items WHERE id=?", (item_id,))
-    conn.commit()
-    conn.close()
+    def write(conn):
+        deleted = conn.execute("DELETE FROM item_data WHERE id=?", (item_id,)).rowcount
+        if deleted:
+            bump_versions(conn, "items")
+            publish_changes(conn, "delete", [item_id])
+        return deleted
+
+    if not submit_write(write):
+        try:
+            month = archived_month_of(db(), item_id)
+        except ValueError as e:
+            flash(f"Entry {item_id} is not live and the archives couldn't be checked: {e}", "error")
+        else:
+            if month:
+                flash(f"Entry {item_id} is archived ({month}); archived entries are kept for audits and can't be deleted.", "error")
     return redirect("/")
 
 @app.post("/options/add")
@@ -704,13 +2933,14 @@ def options_add():
     group = (request.form.get("group") or "").strip()
     value = (request.form.get("value") or "").strip()
     if group in ("line", "shift") and value:
-        conn = db()
-        conn.execute(
-            "INSERT OR IGNORE INTO options (opt_group, opt_value) VALUES (?, ?)",
-            (group, value),
-        )
-        conn.commit()
-        conn.close()
+        def write(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO options (opt_group, opt_value) VALUES (?, ?)",
+                (group, value),
+            )
+            bump_versions(conn, "options")
+
+        submit_write(write)
     return redirect("/")
 
 @app.post("/options/delete")
@@ -719,62 +2949,126 @@ def options_delete():
     group = (request.form.get("group") or "").strip()
     value = (request.form.get("value") or "").strip()
     if group in ("line", "shift") and value:
-        conn = db()
-        cur = conn.execute("SELECT COUNT(*) FROM options WHERE opt_group=?", (group,))
-        if cur.fetchone()[0] > 1:
-            conn.execute("DELETE FROM options WHERE opt_group=? AND opt_value=?", (group, value))
-            conn.commit()
-        conn.close()
+        def write(conn):
+            cur = conn.execute("SELECT COUNT(*) FROM options WHERE opt_group=?", (group,))
+            if cur.fetchone()[0] > 1:
+                conn.execute("DELETE FROM options WHERE opt_group=? AND opt_value=?", (group, value))
+                bump_versions(conn, "options")
+
+        submit_write(write)
     return redirect("/")
 
-@app.get("/export.csv")
-@login_required
-def export_csv():
-    conn = db()
-    rows = conn.execute(
-        """
-        SELECT created_at, parts, line, reason, sequence, shift, notes, comments
-        FROM items
-        ORDER BY id ASC
-        """
-    ).fetchall()
-    conn.close()
+EXPORT_COLUMNS = ("created_at", "parts", "line", "reason", "sequence", "shift", "notes", "comments")
+
+def iter_item_batches(clause, params, columns, size=None, archives=False, filters=None, conn=None):
+    # Keyset batches on id, one short query each: memory stays bounded and no
+    # read lock is held while a slow client drains the previous chunk. Uses its
+    # own connection because the response body is produced after the request ends,
+    # or conn (and whatever transaction it has open) when given.
+    # archives=True also reads the archived months filters reach (all of them
+    # for filters=None) first. The live rows and the catalogue then come from
+    # one read transaction, the months from a second connection attaching one
+    # at a time, and archived rows still live in that snapshot (archived since
+    # it began) are left to the live part, so each entry is read once.
+    size = size or EXPORT_BATCH_SIZE
+    own = conn is None
+    conn = conn or connect()
+    archive_conn = None
+    try:
+        parts = []
+        if archives:
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            parts = archive_parts(conn, filters)
+            archive_conn = connect()
+        for month, part_clause, part_params in parts + [(None, clause, params)]:
+            reader = archive_conn if month else conn
+            if month:
+                attach_archives(reader, [month])
+            table = f"{archive_schema(month)}.item_data" if month else "item_data"
+            source = archive_source(month) if month else "items"
+            # created_at from the offsets of the span being read, as arithmetic
+            # rather than the view's offset lookup per row
+            first, last = reader.execute(
+                f"SELECT (SELECT MIN(created_ts) FROM {table}), (SELECT MAX(created_ts) FROM {table})"
+            ).fetchone()
+            end = (last or 0) if month else max(last or 0, int(time.time()))
+            offset = plant_offset_case_sql("created_ts", first or 0, end + 1)
+            expressions = {"created_at": f"strftime('{TIME_FORMAT}', created_ts + {offset}, 'unixepoch') AS created_at"}
+            select = ", ".join(expressions.get(c, c) for c in columns)
 
+            last_id = -1
+            while True:
+                rows = reader.execute(
+                    f"""
+                    SELECT id, {select}
+                    FROM {source}
+                    {and_where(part_clause, "id > ?")}
+                    ORDER BY id ASC
+                    LIMIT ?
+                    """,
+                    part_params + [last_id, size]
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                if month:
+                    ids = [r["id"] for r in rows]
+                    live = {r[0] for r in conn.execute(
+                        f"SELECT id FROM item_data WHERE id IN ({','.join('?' * len(ids))})", ids
+                    )}
+                    rows = [r for r in rows if r["id"] not in live]
+                    if not rows:
+                        continue
+                yield rows
+    finally:
+        if archive_conn is not None:
+            archive_conn.close()
+        if own:
+            conn.close()
+
+def csv_chunks(batches):
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(["DateTime", "Parts", "Line", "Reason", "Sequence", "Shift", "Notes", "Comments"])
-    for r in rows:
-        writer.writerow([
-            r["created_at"], r["parts"], r["line"], r["reason"], r["sequence"], r["shift"],
-            r["notes"] or "", r["comments"] or ""
-        ])
-
-    return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=tracker.csv"},
-    )
+    for rows in batches:
+        for r in rows:
+            writer.writerow([
+                r["created_at"], r["parts"], r["line"], r["reason"], r["sequence"], r["shift"],
+                r["notes"] or "", r["comments"] or ""
+            ])
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    # Header-only export when nothing matched
+    if output.tell():
+        yield output.getvalue()
 
-@app.get("/export.json")
+@app.get("/export.csv")
 @login_required
-def export_json():
-    conn = db()
-    items = conn.execute(
-        """
-        SELECT id, created_at, parts, line, reason, sequence, shift, notes, comments
-        FROM items
-        ORDER BY id ASC
-        """
-    ).fetchall()
+def export_csv():
+    not_modified, etag, last_modified = conditional_get(db())
+    if not_modified:
+        return not_modified
 
-    line_options = get_options(conn, "line")
-    shift_options = get_options(conn, "shift")
-    conn.close()
+    # Same query-string filters as the home page; no filters exports every live
+    # entry, a date range also the archived months it reaches
+    filters = build_filters(request.args)
+    clause, params = apply_filters_sql(filters)
+    batches = iter_item_batches(clause, params, EXPORT_COLUMNS, archives=True, filters=filters)
+    return with_validators(Response(
+        csv_chunks(batches),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=tracker.csv"},
+    ), etag, last_modified)
 
-    payload = {
-        "options": {"line": line_options, "shift": shift_options},
-        "items": [
-            {
+def backup_chunks(options, batches):
+    # Same document shape /import accepts, one item per line, written as it's read
+    yield '{"options": ' + json.dumps(options, ensure_ascii=False) + ', "items": ['
+    sep = "\n"
+    for rows in batches:
+        yield sep + ",\n".join(
+            json.dumps({
                 "id": r["id"],
                 "created_at": r["created_at"],
                 "parts": r["parts"],
@@ -784,17 +3078,434 @@ def export_json():
                 "shift": r["shift"],
                 "notes": r["notes"],
                 "comments": r["comments"],
-            }
-            for r in items
-        ]
-    }
+            }, ensure_ascii=False)
+            for r in rows
+        )
+        sep = ",\n"
+    yield "\n]}\n"
 
-    return Response(
-        json.dumps(payload, ensure_ascii=False, indent=2),
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def backup_stream():
+    # Options and items from one read transaction, so the backup is a single
+    # state of the database however long the download takes; under WAL it
+    # doesn't hold up writers. Archived months included: a backup holds the
+    # whole scrap history.
+    conn = connect()
+    try:
+        conn.execute("BEGIN")
+        options = {"line": get_options(conn, "line"), "shift": get_options(conn, "shift")}
+        yield from backup_chunks(options, iter_item_batches("", [], EXPORT_COLUMNS, archives=True, conn=conn))
+    finally:
+        conn.close()
+
+@app.get("/export.json")
+@login_required
+def export_json():
+    not_modified, etag, last_modified = conditional_get(db())
+    if not_modified:
+        return not_modified
+
+    return with_validators(Response(
+        backup_stream(),
         mimetype="application/json",
         headers={"Content-Disposition": "attachment; filename=tracker-backup.json"},
+    ), etag, last_modified)
+
+@app.get("/export.json.gz")
+@login_required
+def export_json_gz():
+    not_modified, etag, last_modified = conditional_get(db())
+    if not_modified:
+        return not_modified
+
+    return with_validators(Response(
+        gzip_chunks(backup_stream()),
+        mimetype="application/gzip",
+        headers={"Content-Disposition": "attachment; filename=tracker-backup.json.gz"},
+    ), etag, last_modified)
+
+class BackupError(ValueError):
+    pass
+
+def open_backup(fileobj):
+    # Plain or gzip-compressed backup, sniffed from the first bytes
+    head = fileobj.read(2)
+    fileobj.seek(0)
+    if head == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return fileobj
+
+def iter_backup(fileobj):
+    # Incremental reader for {"options": {...}, "items": [...]}: yields ("item", obj)
+    # for each entry as soon as it's complete and (key, value) for other top-level
+    # keys, keeping only the unparsed tail of the input in memory.
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        chunk = fileobj.read(IMPORT_READ_SIZE)
+        eof = not chunk
+        buf = buf[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return ""
+            more()
+
+    def expect(chars):
+        nonlocal pos
+        ch = peek()
+        if not ch or ch not in chars:
+            raise BackupError(f"expected one of {chars!r}, found {ch or 'end of file'!r}")
+        pos += 1
+        return ch
+
+    def value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # Only an error at the end of the buffer (a value cut off by the
+                # read size: the longest is a \uXXXX surrogate pair) or an open
+                # string can be fixed by reading on; anything else fails now,
+                # without pulling the rest of the upload into memory
+                if eof or not (len(buf) - e.pos < 16 or e.msg.startswith("Unterminated string")):
+                    raise BackupError(f"invalid JSON: {e.msg}") from None
+                more()
+                continue
+            # A value ending exactly at the buffer edge may be a truncated number
+            if end == len(buf) and not eof:
+                more()
+                continue
+            pos = end
+            return obj
+
+    if buf == "":
+        more()
+    if buf.startswith("\ufeff"):
+        pos = 1
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = value()
+        if not isinstance(key, str):
+            raise BackupError("expected an object key")
+        expect(":")
+        if key == "items":
+            expect("[")
+            if peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    yield "item", value()
+                    if expect(",]") == "]":
+                        break
+        else:
+            yield key, value()
+        if expect(",}") == "}":
+            break
+
+def import_row(r, now):
+    # Same coercions the restore always applied, with a readable reason on failure
+    if not isinstance(r, dict):
+        raise ValueError("entry is not an object")
+    missing = [k for k in ("id", "parts", "line", "reason", "sequence", "shift") if r.get(k) is None]
+    if missing:
+        raise ValueError("missing " + ", ".join(missing))
+
+    def integer(key):
+        try:
+            return int(r[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} is not a number: {r[key]!r}") from None
+
+    def timestamp(key):
+        # Exports write plant time; a backup without one gets the restore's time
+        if not r.get(key):
+            return now
+        try:
+            return plant_epoch(str(r[key]))
+        except ValueError:
+            raise ValueError(f"{key} is not a date and time: {r[key]!r}") from None
+
+    return (
+        integer("id"),
+        str(r["parts"]),
+        str(r["line"]),
+        str(r["reason"]),
+        integer("sequence"),
+        str(r["shift"]),
+        timestamp("created_at"),
+        (r.get("notes") or None),
+        (r.get("comments") or None),
+    )
+
+# Takes an item row in view column order, with created_ts for created_at;
+# id may be None for a new entry
+INSERT_ITEM_DATA = f"""
+    INSERT INTO item_data (id, parts, line_id, reason_id, sequence, shift_id, created_ts, notes, comments)
+    VALUES (?, ?, {dictionary_id("line", "?")}, {dictionary_id("reason", "?")}, ?,
+            {dictionary_id("shift", "?")}, ?, ?, ?)
+"""
+
+def intern_item_values(conn, rows):
+    # Dictionary ids for every line, reason and shift in rows, before they're written
+    for _, table, position in ITEM_DICTIONARIES:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {table} (name) VALUES (?)",
+            [(v,) for v in {r[position] for r in rows}]
+        )
+
+def insert_item(conn, values):
+    # Returns the new id
+    intern_item_values(conn, [values])
+    return conn.execute(INSERT_ITEM_DATA, values).lastrowid
+
+def insert_import_batch(conn, batch, errors):
+    # batch holds (row number, values); on a constraint error retry row by row
+    # so the report names the offending entries
+    conn.execute("SAVEPOINT import_batch")
+    try:
+        intern_item_values(conn, [values for _, values in batch])
+        conn.executemany(INSERT_ITEM_DATA, [values for _, values in batch])
+    except sqlite3.IntegrityError:
+        conn.execute("ROLLBACK TO import_batch")
+        intern_item_values(conn, [values for _, values in batch])
+        for number, values in batch:
+            try:
+                conn.execute(INSERT_ITEM_DATA, values)
+            except sqlite3.IntegrityError as e:
+                errors.append((number, str(e)))
+    conn.execute("RELEASE import_batch")
+
+def suspend_item_triggers(conn):
+    # Dropped inside the restore transaction (DDL is transactional in SQLite) so the
+    # bulk delete/insert skips per-row FTS and rollup upkeep; rebuilt in bulk after
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='trigger' AND tbl_name='item_data'"
+    ).fetchall()
+    for t in triggers:
+        conn.execute(f"DROP TRIGGER {t['name']}")
+    return [t["sql"] for t in triggers]
+
+def rebuild_item_derived(conn, trigger_sql):
+    if FTS_ENABLED:
+        conn.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+    refill_rollups(conn)
+    for sql in trigger_sql:
+        conn.execute(sql)
+
+def merge_import_batch(conn, batch, result, readers=()):
+    # Upsert by id, touching only rows whose content differs from the live row.
+    # Both sides are in hand, so the normalized value tuple is compared directly:
+    # the same test a content hash would make, minus the hashing.
+    # An id that isn't live but is in an archive file (readers from
+    # open_archive_readers) is left to the archives, counted, never given a
+    # second copy.
+    ids = [values[0] for _, values in batch]
+    existing = {
+        r["id"]: tuple(r)
+        for r in conn.execute(
+            f"""
+            SELECT id, parts, line, reason, sequence, shift, created_ts, notes, comments
+            FROM items WHERE id IN ({",".join("?" * len(ids))})
+            """,
+            ids
+        )
+    }
+    archived = archived_ids(readers, [i for i in ids if i not in existing])
+
+    inserts = []
+    updates = []
+    for number, values in batch:
+        old = existing.get(values[0])
+        if old == values:
+            result["unchanged"] += 1
+            continue
+        if old is None and values[0] in archived:
+            result["archived"] += 1
+            continue
+        if old is None:
+            inserts.append((number, values))
+            result["inserted"] += 1
+        else:
+            updates.append(values[1:] + values[:1])
+            result["updated"] += 1
+        existing[values[0]] = values
+
+    insert_import_batch(conn, inserts, result["errors"])
+    intern_item_values(conn, [(None,) + u[:-1] for u in updates])
+    conn.executemany(
+        f"""
+        UPDATE item_data
+        SET parts=?, line_id={dictionary_id("line", "?")}, reason_id={dictionary_id("reason", "?")},
+            sequence=?, shift_id={dictionary_id("shift", "?")}, created_ts=?, notes=?, comments=?
+        WHERE id=?
+        """,
+        updates
     )
 
+def restore_backup(conn, fileobj, batch_size=None, merge=False, prune=False):
+    # Restore options and items from a backup in one transaction. Rows are
+    # validated and written in executemany batches as they're parsed; any error
+    # rolls the whole restore back and is reported with its entry number.
+    #
+    # Default: replace everything, archived months included: their catalogue
+    # entries go and the files are set aside (see set_aside_archives), as
+    # backups carry the archived entries too. merge=True upserts by id and
+    # leaves unchanged rows alone, so the writes scale with the difference;
+    # prune=True also deletes entries and options the backup doesn't have.
+    # Neither touches the archives. New ids stay above every id ever used
+    # (item_data is AUTOINCREMENT), archived or restored.
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    now = int(time.time())
+    result = {
+        "items": 0, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "archived": 0,
+        "set_aside": None, "errors": [],
+    }
+    replaced_months = []
+    readers = []
+    batch = []
+
+    def flush():
+        if merge:
+            merge_import_batch(conn, batch, result, readers)
+        else:
+            insert_import_batch(conn, batch, result["errors"])
+            result["inserted"] += len(batch)
+        if prune:
+            conn.executemany(
+                "INSERT OR IGNORE INTO temp.import_seen (id) VALUES (?)",
+                [(values[0],) for _, values in batch]
+            )
+        batch.clear()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if merge:
+            trigger_sql = None
+            try:
+                readers = open_archive_readers(conn)
+            except ValueError as e:
+                raise BackupError(f"{e}; a merge checks entries against every archived month") from None
+            if prune:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_seen (id INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM temp.import_seen")
+        else:
+            trigger_sql = suspend_item_triggers(conn)
+            conn.execute("DELETE FROM options WHERE opt_group IN ('line','shift')")
+            conn.execute("DELETE FROM item_data")
+            replaced_months = [r["month"] for r in conn.execute("SELECT month FROM archives")]
+            conn.execute("DELETE FROM archives")
+
+        for kind, value in iter_backup(open_backup(fileobj)):
+            if kind == "options":
+                if not isinstance(value, dict):
+                    raise BackupError("options must be an object")
+                options = value
+                for group in ("line", "shift"):
+                    values = options.get(group, [])
+                    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                        raise BackupError(f"options.{group} must be a list of text values")
+                    values = [v.strip() for v in values]
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO options (opt_group, opt_value) VALUES (?, ?)",
+                        [(group, v) for v in values]
+                    )
+                    if merge and prune and group in options:
+                        conn.execute(
+                            f"""
+                            DELETE FROM options WHERE opt_group=?
+                            AND opt_value NOT IN ({",".join("?" * len(values))})
+                            """,
+                            [group] + values
+                        )
+                continue
+            if kind != "item":
+                continue
+
+            result["items"] += 1
+            try:
+                values = import_row(value, now)
+            except ValueError as e:
+                result["errors"].append((result["items"], str(e)))
+                continue
+            # After the first error only keep validating: the restore will be rolled back
+            if not result["errors"]:
+                batch.append((result["items"], values))
+                if len(batch) >= batch_size:
+                    flush()
+
+        if batch and not result["errors"]:
+            flush()
+        if merge and prune and not result["errors"]:
+            result["deleted"] = conn.execute(
+                "DELETE FROM item_data WHERE id NOT IN (SELECT id FROM temp.import_seen)"
+            ).rowcount
+    except BackupError as e:
+        conn.rollback()
+        result["errors"].append((None, str(e)))
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for _, reader in readers:
+            reader.close()
+
+    if result["errors"]:
+        conn.rollback()
+        return result
+
+    ensure_default_options(conn, "line", DEFAULT_LINE_OPTIONS)
+    ensure_default_options(conn, "shift", DEFAULT_SHIFT_OPTIONS)
+    if trigger_sql is not None:
+        rebuild_item_derived(conn, trigger_sql)
+    bump_versions(conn, "items", "options")
+    publish_changes(conn, "reload")
+    conn.commit()
+    if replaced_months:
+        result["set_aside"] = set_aside_archives(replaced_months, "replaced")
+    return result
+
+def flash_import_errors(errors):
+    flash("Restore failed, nothing was changed.", "error")
+    for number, message in errors[:IMPORT_ERRORS_SHOWN]:
+        flash(f"Entry {number}: {message}" if number else message, "error")
+    if len(errors) > IMPORT_ERRORS_SHOWN:
+        flash(f"...and {len(errors) - IMPORT_ERRORS_SHOWN} more problems.", "error")
+
+def import_summary(result, merge):
+    if merge:
+        return (
+            f"Merged {result['items']} entries: {result['inserted']} new, "
+            f"{result['updated']} updated, {result['unchanged']} unchanged, "
+            f"{result['deleted']} deleted."
+            + (f" {result['archived']} already archived were left as they are." if result.get("archived") else "")
+        )
+    if result.get("set_aside"):
+        return f"Restored {result['items']} entries; the archived months it replaced were moved to {result['set_aside']}."
+    return f"Restored {result['items']} entries."
+
 @app.post("/import")
 @login_required
 def import_():
@@ -802,76 +3513,884 @@ def import_():
     if not f:
         return redirect("/")
 
-    data = json.loads(f.read().decode("utf-8"))
-    options = data.get("options", {})
-    items = data.get("items", [])
+    merge = request.form.get("mode") == "merge"
+    prune = merge and bool(request.form.get("prune"))
+    result = submit_write(
+        lambda conn: restore_backup(conn, f.stream, merge=merge, prune=prune),
+        own_transaction=True
+    )
+    if result["errors"]:
+        flash_import_errors(result["errors"])
+    else:
+        flash(import_summary(result, merge), "ok")
+    return redirect("/")
 
-    conn = db()
+# Exports and restores run as background jobs instead of inside the request:
+# on a large database they'd outlast the gunicorn timeout and hold a sync
+# worker the line stations need. The jobs table lets any worker report a job;
+# the work itself runs on a thread pool in the worker that accepted it.
+_jobs = {"pid": None, "executor": None}
+_jobs_lock = threading.Lock()
 
-    # Restore options (overwrite)
-    conn.execute("DELETE FROM options WHERE opt_group IN ('line','shift')")
-    for v in options.get("line", []):
-        conn.execute("INSERT OR IGNORE INTO options (opt_group, opt_value) VALUES ('line', ?)", (str(v).strip(),))
-    for v in options.get("shift", []):
-        conn.execute("INSERT OR IGNORE INTO options (opt_group, opt_value) VALUES ('shift', ?)", (str(v).strip(),))
+def job_executor():
+    with _jobs_lock:
+        if _jobs["pid"] != os.getpid():
+            _jobs["pid"] = os.getpid()
+            _jobs["executor"] = ThreadPoolExecutor(JOB_WORKERS, thread_name_prefix="job")
+        return _jobs["executor"]
 
-    ensure_default_options(conn, "line", DEFAULT_LINE_OPTIONS)
-    ensure_default_options(conn, "shift", DEFAULT_SHIFT_OPTIONS)
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, str(job_id))
 
-    # Restore items (overwrite)
-    conn.execute("DELETE FROM items")
-    for r in items:
-        conn.execute(
+def update_job(job_id, **fields):
+    fields["updated_at"] = int(time.time())
+    submit_write(lambda conn: conn.execute(
+        f"UPDATE jobs SET {', '.join(f'{k}=?' for k in fields)} WHERE id=?",
+        list(fields.values()) + [job_id]
+    ))
+
+def job_reporter(job_id):
+    # Progress goes to a file next to the output, not the jobs table: a restore
+    # holds SQLite's write lock for its whole run
+    path = os.path.join(job_dir(job_id), "progress")
+    state = {"progress": 0, "total": None, "written": 0.0}
+
+    def report(progress, total=None):
+        state["progress"] = progress
+        if total is not None:
+            state["total"] = total
+        now = time.monotonic()
+        if now - state["written"] >= JOB_PROGRESS_INTERVAL:
+            state["written"] = now
+            with open(path + ".tmp", "w") as f:
+                json.dump({"progress": progress, "total": state["total"]}, f)
+            os.replace(path + ".tmp", path)
+
+    return report, state
+
+def read_progress(job_id):
+    try:
+        with open(os.path.join(job_dir(job_id), "progress")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def reported_batches(batches, report):
+    done = 0
+    for rows in batches:
+        yield rows
+        done += len(rows)
+        report(done)
+
+def write_job_file(path, chunks):
+    # Written under a temporary name so a download never sees a partial file
+    with open(path + ".part", "wb") as f:
+        for chunk in chunks:
+            f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+    os.replace(path + ".part", path)
+
+def job_export_csv(conn, job_id, params, report):
+    filters = build_filters(params)
+    clause, args = apply_filters_sql(filters)
+    total = conn.execute(f"SELECT COUNT(*) FROM items {clause}", args).fetchone()[0]
+    for month, archive_clause, archive_args in archive_parts(conn, filters):
+        attach_archives(conn, [month])
+        total += conn.execute(
+            f"SELECT COUNT(*) FROM {archive_source(month)} {archive_clause}", archive_args
+        ).fetchone()[0]
+    attach_archives(conn, [])
+    report(0, total)
+    batches = iter_item_batches(clause, args, EXPORT_COLUMNS, archives=True, filters=filters)
+    batches = reported_batches(batches, report)
+    write_job_file(job_file(job_id, "export_csv"), csv_chunks(batches))
+
+def job_export_json(conn, job_id, params, report, compress=False):
+    # One read transaction for the whole file, as in backup_stream()
+    conn.execute("BEGIN")
+    options = {"line": get_options(conn, "line"), "shift": get_options(conn, "shift")}
+    report(0, conn.execute(
+        "SELECT (SELECT COUNT(*) FROM items) + (SELECT COALESCE(SUM(items), 0) FROM archives)"
+    ).fetchone()[0])
+    batches = iter_item_batches("", [], EXPORT_COLUMNS, archives=True, conn=conn)
+    chunks = backup_chunks(options, reported_batches(batches, report))
+    kind = "export_json_gz" if compress else "export_json"
+    write_job_file(job_file(job_id, kind), gzip_chunks(chunks) if compress else chunks)
+    conn.rollback()
+
+def job_export_json_gz(conn, job_id, params, report):
+    job_export_json(conn, job_id, params, report, compress=True)
+
+class UploadReader:
+    # Reports how many bytes of the saved upload the restore has consumed
+    def __init__(self, fileobj, report):
+        self.fileobj = fileobj
+        self.report = report
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.report(self.fileobj.tell())
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+def job_import(conn, job_id, params, report):
+    path = os.path.join(job_dir(job_id), "upload")
+    report(0, os.path.getsize(path))
+    merge, prune = params["merge"], params["prune"]
+    try:
+        with open(path, "rb") as f:
+            reader = UploadReader(f, report)
+            return submit_write(
+                lambda wconn: restore_backup(wconn, reader, merge=merge, prune=prune),
+                own_transaction=True
+            )
+    finally:
+        os.remove(path)
+
+# kind -> runner, download file name, mimetype (None: no file), progress unit
+JOB_KINDS = {
+    "export_csv": (job_export_csv, "tracker.csv", "text/csv", "rows"),
+    "export_json": (job_export_json, "tracker-backup.json", "application/json", "rows"),
+    "export_json_gz": (job_export_json_gz, "tracker-backup.json.gz", "application/gzip", "rows"),
+    "import": (job_import, None, None, "bytes"),
+}
+
+def job_file(job_id, kind):
+    return os.path.join(job_dir(job_id), JOB_KINDS[kind][1])
+
+def run_background_job(job_id, kind, params):
+    report, state = job_reporter(job_id)
+    conn = connect()
+    try:
+        update_job(job_id, status="running")
+        result = JOB_KINDS[kind][0](conn, job_id, params, report)
+        update_job(
+            job_id, status="done", progress=state["progress"], total=state["total"],
+            result=json.dumps(result) if result is not None else None
+        )
+    except Exception as e:
+        app.logger.exception("job %s (%s) failed", job_id, kind)
+        update_job(job_id, status="failed", error=str(e) or type(e).__name__)
+    finally:
+        conn.close()
+
+def start_job(kind, params, upload=None):
+    now = int(time.time())
+
+    def write(conn):
+        expired = [r[0] for r in conn.execute(
+            "SELECT id FROM jobs WHERE updated_at < ? AND status IN ('done', 'failed')",
+            (now - JOB_TTL,)
+        )]
+        conn.executemany("DELETE FROM jobs WHERE id=?", [(i,) for i in expired])
+        job_id = conn.execute(
             """
-            INSERT INTO items (id, parts, line, reason, sequence, shift, created_at, notes, comments)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO jobs (kind, status, params, pid, created_at, updated_at)
+            VALUES (?, 'queued', ?, ?, ?, ?)
             """,
-            (
-                int(r["id"]),
-                str(r["parts"]),
-                str(r["line"]),
-                str(r["reason"]),
-                int(r["sequence"]),
-                str(r["shift"]),
-                str(r.get("created_at") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                (r.get("notes") or None),
-                (r.get("comments") or None),
-            ),
-        )
+            (kind, json.dumps(params), os.getpid(), now, now)
+        ).lastrowid
+        return job_id, expired
 
-    conn.commit()
-    conn.close()
-    return redirect("/")
+    job_id, expired = submit_write(write)
+    for old_id in expired:
+        shutil.rmtree(job_dir(old_id), ignore_errors=True)
 
-if __name__ == "__main__":
-    app.run()
-def make_bar_data(items, key):
+    os.makedirs(job_dir(job_id), exist_ok=True)
+    if upload is not None:
+        upload.save(os.path.join(job_dir(job_id), "upload"))
+    job_executor().submit(run_background_job, job_id, kind, params)
+    return job_id
 
-    counts = {}
+def job_request(args, files):
+    # (kind, params, upload) from a form or JSON body, or ValueError
+    kind = str(args.get("kind") or "")
+    if kind not in JOB_KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(JOB_KINDS)}")
+    if kind == "export_csv":
+        # A JSON body can carry numbers, lists or objects where filters are text
+        invalid = [n for n in FILTER_ARGS if not isinstance(args.get(n, ""), (str, type(None)))]
+        if invalid:
+            raise ValueError(f"{', '.join(invalid)} must be text")
+        return kind, filter_query(build_filters(args)), None
+    if kind == "import":
+        upload = files.get("file")
+        if not upload:
+            raise ValueError("a backup file is required")
+        merge = args.get("mode") == "merge"
+        return kind, {"merge": merge, "prune": merge and bool(args.get("prune"))}, upload
+    return kind, {}, None
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def job_status(job_id):
+    row = db().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    job = {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "progress": row["progress"],
+        "total": row["total"],
+        "params": json.loads(row["params"]),
+        "unit": JOB_KINDS[row["kind"]][3],
+        "error": row["error"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "download": None,
+    }
+    if job["status"] in ("queued", "running"):
+        if not pid_alive(row["pid"]):
+            # The worker was restarted or killed mid-job
+            job["status"] = "failed"
+            job["error"] = "the worker running this job exited"
+            update_job(job_id, status="failed", error=job["error"])
+        else:
+            job.update(read_progress(job_id))
+    elif job["status"] == "done" and JOB_KINDS[job["kind"]][1]:
+        job["download"] = url_for("job_download", job_id=job_id)
+    return job
 
-    for i in items:
+@app.post("/jobs")
+@login_required
+def jobs_create():
+    try:
+        kind, params, upload = job_request(request.form, request.files)
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect("/")
+    return redirect(url_for("job_page", job_id=start_job(kind, params, upload)))
 
-        value = i.get(key)
+@app.get("/jobs/<int:job_id>")
+@login_required
+def job_page(job_id):
+    job = job_status(job_id)
+    if job is None:
+        return redirect("/")
 
-        if value:
+    titles = {"export_csv": "CSV export", "export_json": "Backup", "export_json_gz": "Backup", "import": "Restore"}
+    result = job["result"] or {}
+    return render_template(
+        "job.html",
+        job=job,
+        title=titles[job["kind"]],
+        errors=result.get("errors", [])[:IMPORT_ERRORS_SHOWN],
+        summary=import_summary(result, job["params"]["merge"]) if job["kind"] == "import" and result else "",
+    )
 
-            counts[value] = counts.get(value, 0) + 1
+@app.get("/jobs/<int:job_id>/download")
+@login_required
+def job_download(job_id):
+    job = job_status(job_id)
+    if job is None or not job["download"]:
+        return redirect(url_for("job_page", job_id=job_id))
+    _, name, mimetype, _ = JOB_KINDS[job["kind"]]
+    return send_file(
+        os.path.abspath(job_file(job_id, job["kind"])),
+        mimetype=mimetype, as_attachment=True, download_name=name
+    )
 
-    max_val = max(counts.values()) if counts else 1
+@app.post("/api/jobs")
+@api_auth_required
+def api_jobs_create():
+    # Form fields or a JSON object: kind, the filter arguments for export_csv,
+    # and for import a multipart "file" plus optional mode/prune
+    args = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(args, dict) and args is not request.form:
+        return jsonify(error="expected a JSON object"), 400
+    try:
+        kind, params, upload = job_request(args, request.files)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    job_id = start_job(kind, params, upload)
+    response = jsonify(job_status(job_id))
+    response.status_code = 202
+    response.headers["Location"] = url_for("api_job", job_id=job_id)
+    return response
 
-    bars = []
+@app.get("/api/jobs/<int:job_id>")
+@api_auth_required
+def api_job(job_id):
+    job = job_status(job_id)
+    if job is None:
+        return jsonify(error="no such job"), 404
+    return jsonify(job)
 
-    for name, val in sorted(counts.items()):
+def api_entry(entry, line_options, shift_options):
+    # The fields add() takes, checked against the configured dropdowns
+    if not isinstance(entry, dict):
+        raise ValueError("entry is not an object")
 
-        bars.append({
+    def text(key, required=True):
+        value = entry.get(key)
+        value = "" if value is None else str(value).strip()
+        if required and not value:
+            raise ValueError(f"{key} is required")
+        return value or None
 
-            "label": name,
+    parts, line, reason, shift = text("parts"), text("line"), text("reason"), text("shift")
+    try:
+        sequence = int(str(entry.get("sequence")).strip())
+    except ValueError:
+        raise ValueError(f"sequence is not a number: {entry.get('sequence')!r}") from None
+    if line not in line_options:
+        raise ValueError(f"unknown line: {line!r}")
+    if shift not in shift_options:
+        raise ValueError(f"unknown shift: {shift!r}")
+    return parts, line, reason, sequence, shift, text("notes", False), text("comments", False)
 
-            "value": val,
+@app.post("/api/items")
+@api_auth_required
+def api_items_create():
+    # Batch entry for scanners: validate everything, insert in one transaction,
+    # return the new ids. A retried batch with the same Idempotency-Key gets the
+    # original response instead of inserting twice.
+    data = request.get_json(silent=True)
+    entries = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        return jsonify(error="expected a non-empty JSON array of entries"), 400
+    if len(entries) > API_MAX_BATCH:
+        return jsonify(error=f"at most {API_MAX_BATCH} entries per request"), 413
 
-            "percent": int((val / max_val) * 100)
+    line_options, shift_options = option_lists(db())
+    rows = []
+    errors = []
+    for index, entry in enumerate(entries):
+        try:
+            rows.append(api_entry(entry, line_options, shift_options))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        return jsonify(errors=errors), 422
 
-        })
+    key = request.headers.get("Idempotency-Key", "").strip()
+    request_hash = hashlib.sha1(
+        json.dumps(entries, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    created_ts = int(time.time())
 
-    return bars
- 
+    def write(conn):
+        if key:
+            seen = conn.execute(
+                "SELECT request_hash, response FROM idempotency_keys WHERE key=? AND created_at >= ?",
+                (key, int(time.time()) - IDEMPOTENCY_TTL)
+            ).fetchone()
+            if seen:
+                return {"replayed": True, "conflict": seen["request_hash"] != request_hash,
+                        "body": json.loads(seen["response"])}
+
+        ids = [
+            insert_item(conn, (None, parts, line, reason, sequence, shift, created_ts, notes, comments))
+            for parts, line, reason, sequence, shift, notes, comments in rows
+        ]
+        bump_versions(conn, "items")
+        publish_changes(conn, "add", ids)
+
+        body = {"ids": ids}
+        if key:
+            now = int(time.time())
+            conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - IDEMPOTENCY_TTL,))
+            conn.execute(
+                "INSERT INTO idempotency_keys (key, request_hash, response, created_at) VALUES (?, ?, ?, ?)",
+                (key, request_hash, json.dumps(body), now),
+            )
+        return {"replayed": False, "conflict": False, "body": body}
+
+    result = submit_write(write)
+    if result["conflict"]:
+        return jsonify(error="Idempotency-Key was already used for a different batch"), 409
+    return jsonify(result["body"]), 200 if result["replayed"] else 201
+
+def compact_json(payload, status=200):
+    return Response(
+        json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+        status=status,
+        mimetype="application/json",
+    )
+
+@app.get("/api/items")
+@api_auth_required
+def api_items_list():
+    # Same filters and keyset cursors as the dashboard (before/after/per_page);
+    # ?fields=parts,line,... limits the columns read and returned
+    conn = db()
+    not_modified, etag, last_modified = conditional_get(conn)
+    if not_modified:
+        return not_modified
+
+    fields = [f.strip() for f in (request.args.get("fields") or "").split(",") if f.strip()]
+    unknown = sorted(set(fields) - set(ITEM_FIELDS))
+    if unknown:
+        return jsonify(error="unknown fields: " + ", ".join(unknown)), 400
+    fields = fields or list(ITEM_FIELDS)
+
+    try:
+        queries = item_queries(conn, build_filters(request.args))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    page = fetch_page(conn, None, None, page_args(request.args), fields, queries=queries)
+    return with_validators(compact_json({
+        "items": [{f: r[f] for f in fields} for r in page["rows"]],
+        "cursor": {"older": page["older"], "newer": page["newer"]},
+    }), etag, last_modified)
+
+@app.get("/api/totals")
+@api_auth_required
+def api_totals():
+    conn = db()
+    not_modified, etag, last_modified = conditional_get(conn)
+    if not_modified:
+        return not_modified
+
+    filters = build_filters(request.args)
+    try:
+        queries = item_queries(conn, filters)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    t = filtered_totals(conn, filters, queries)
+
+    def counts(pairs):
+        return [{"label": label, "count": n} for label, n in pairs]
+
+    return with_validators(compact_json({
+        "total": t["total"],
+        "shown": t["shown"],
+        "by_line": counts(t["by_line"]),
+        "by_shift": counts(t["by_shift"]),
+        "by_reason": counts(t["by_reason"]),
+    }), etag, last_modified)
+
+# /events: one poller thread per process reads the change feed and fans each
+# batch out to the connected dashboards' queues, so a stream holds neither a
+# database connection nor a sync worker, just a thread of the gthread worker
+# parked on its queue. Dashboards sharing a filter set share one render.
+_subscribers = []
+_feed = {"pid": None, "last_id": 0}
+_feed_lock = threading.Lock()
+
+def change_event(conn, filters, changes):
+    # The "change" payload for one filter set: rows to prepend (newest first),
+    # ids to remove, and fresh totals
+    added = [c["item_id"] for c in changes if c["kind"] == "add"]
+    deleted = [c["item_id"] for c in changes if c["kind"] == "delete"]
+    clause, params = apply_filters_sql(filters)
+    rows = []
+    if added:
+        rows = conn.execute(
+            f"""
+            SELECT {", ".join(ITEM_FIELDS)} FROM items
+            {and_where(clause, f"id IN ({','.join('?' * len(added))})")}
+            ORDER BY id DESC
+            """,
+            params + added
+        ).fetchall()
+    summary = totals_fragment(conn, filters)
+    return {
+        "added": [render_template("row.html", i=r) for r in rows],
+        "deleted": deleted,
+        "totals": summary["html"],
+        "bars": summary["bars_html"],
+        "total": summary["total"],
+        "shown": summary["shown"],
+    }
+
+def read_changes(conn, after_id):
+    return conn.execute(
+        "SELECT id, kind, item_id FROM changes WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, CHANGES_BATCH)
+    ).fetchall()
+
+def feed_events(conn, changes, filter_sets):
+    # {filters key: (event name, payload)} for one batch of changes
+    if len(changes) == CHANGES_BATCH or any(c["kind"] == "reload" for c in changes):
+        return {key: ("reload", {}) for key in filter_sets}
+    data_versions(conn)  # drops the cached totals the batch made stale
+    return {key: ("change", change_event(conn, dict(key), changes)) for key in filter_sets}
+
+def run_change_poller():
+    conn = connect()
+    while True:
+        time.sleep(EVENTS_POLL_INTERVAL)
+        try:
+            # Held while rendering so a dashboard can't subscribe between the
+            # batch being read and it being delivered
+            with _feed_lock:
+                changes = read_changes(conn, _feed["last_id"])
+                if not changes:
+                    continue
+                _feed["last_id"] = changes[-1]["id"]
+                with app.app_context():
+                    events = feed_events(conn, changes, {sub["filters"] for sub in _subscribers})
+                for sub in list(_subscribers):
+                    deliver(sub, changes[-1]["id"], *events[sub["filters"]])
+        except Exception:
+            app.logger.exception("change feed poll failed")
+
+def deliver(sub, event_id, name, payload):
+    try:
+        sub["queue"].put_nowait((event_id, name, payload))
+    except queue.Full:
+        # Fell too far behind: drop what's queued and have its page reload
+        _subscribers.remove(sub)
+        while True:
+            try:
+                sub["queue"].get_nowait()
+            except queue.Empty:
+                break
+        sub["queue"].put_nowait((event_id, "reload", {}))
+
+def subscribe(filters):
+    # Returns the subscriber and the last change id already delivered to the
+    # feed; anything after it arrives on the subscriber's queue
+    with _feed_lock:
+        if _feed["pid"] != os.getpid():
+            _feed["pid"] = os.getpid()
+            _subscribers.clear()
+            _feed["last_id"] = db().execute("SELECT COALESCE(MAX(id), 0) FROM changes").fetchone()[0]
+            threading.Thread(target=run_change_poller, name="change-feed", daemon=True).start()
+        if len(_subscribers) >= EVENTS_MAX_CLIENTS:
+            return None, None
+        sub = {"filters": tuple(sorted(filters.items())), "queue": queue.Queue(EVENTS_QUEUE_SIZE)}
+        _subscribers.append(sub)
+        return sub, _feed["last_id"]
+
+def sse(event_id, name, payload):
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.get("/events")
+@login_required
+def events():
+    filters = build_filters(request.args)
+    since = request.headers.get("Last-Event-ID") or request.args.get("since") or ""
+    sub, last_id = subscribe(filters)
+    if sub is None:
+        # EventSource retries; the page works without live updates meanwhile
+        return Response("too many live dashboards\n", status=503, mimetype="text/plain")
+
+    # Catch up on what happened between the page render (or a dropped
+    # connection) and subscribing
+    first = None
+    if since.isdigit() and int(since) < last_id:
+        gap = [c for c in read_changes(db(), int(since)) if c["id"] <= last_id]
+        if gap and gap[-1]["id"] == last_id:
+            name, payload = feed_events(db(), gap, [sub["filters"]])[sub["filters"]]
+        else:
+            name, payload = "reload", {}
+        first = sse(last_id, name, payload)
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            if first:
+                yield first
+            while True:
+                try:
+                    event_id, name, payload = sub["queue"].get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse(event_id, name, payload)
+                if name == "reload":
+                    return
+        finally:
+            with _feed_lock:
+                if sub in _subscribers:
+                    _subscribers.remove(sub)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@app.get("/metrics")
+@api_auth_required
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.get("/api/trends")
+@api_auth_required
+def api_trends():
+    # ?bucket=hour|shift_day|week|month&group=line|shift|reason|none&window=N
+    # plus the dashboard filters; from/to default to the bucket's usual span
+    conn = db()
+    not_modified, etag, last_modified = conditional_get(conn, plant_today())
+    if not_modified:
+        return not_modified
+
+    bucket = request.args.get("bucket", "month")
+    group = request.args.get("group", "line")
+    if bucket not in TREND_BUCKETS:
+        return jsonify(error=f"bucket must be one of: {', '.join(TREND_BUCKETS)}"), 400
+    if group not in TREND_GROUPS:
+        return jsonify(error=f"group must be one of: {', '.join(TREND_GROUPS)}"), 400
+    window = request.args.get("window", type=int)
+    if window is not None and window < 1:
+        return jsonify(error="window must be a positive integer"), 400
+
+    try:
+        trends = compute_trends(conn, build_filters(request.args), bucket, group, window)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return with_validators(compact_json(trends), etag, last_modified)
+
+class PlanRecorder:
+    # Stands in for a connection: records EXPLAIN QUERY PLAN for every statement it runs
+    def __init__(self, conn):
+        self.conn = conn
+        self.plans = []
+
+    def execute(self, sql, params=()):
+        plan = self.conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        self.plans.append((sql, [r["detail"] for r in plan]))
+        return self.conn.execute(sql, params)
+
+# Sample values only shape the plan; the filters themselves come from build_filters.
+# Text searches are sampled as whole words: substring searches fall back to LIKE and scan.
+INDEXED_FILTER_SAMPLES = {
+    "f_line": DEFAULT_LINE_OPTIONS[0],
+    "f_shift": DEFAULT_SHIFT_OPTIONS[0],
+    "q": "bolt",
+    "f_reason": "scratch",
+    "from": "2026-01-01",
+    "to": "2026-01-31",
+}
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    """Fail if any filter combination makes the home page queries scan items."""
+    conn = connect()
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    missing = sorted(set(ITEM_DATA_TS_INDEXES) - existing)
+    if missing:
+        raise click.ClickException("missing indexes: " + ", ".join(missing))
+
+    failures = 0
+    names = list(INDEXED_FILTER_SAMPLES)
+    for size in range(1, len(names) + 1):
+        for combo in combinations(names, size):
+            filters = build_filters({n: INDEXED_FILTER_SAMPLES[n] for n in combo})
+            clause, params = apply_filters_sql(filters)
+
+            recorder = PlanRecorder(conn)
+            totals_for(recorder, clause, params)
+            for cursor in ({"before": None, "after": None},
+                           {"before": 1 << 62, "after": None},
+                           {"before": None, "after": 0}):
+                fetch_page(recorder, clause, params, dict(cursor, per_page=PAGE_SIZE))
+
+            # "SCAN (subquery-N)" only walks an already-filtered intermediate result,
+            # and an FTS5 MATCH is reported as a SCAN of its virtual table index
+            scans = sorted({
+                d for _, plan in recorder.plans for d in plan
+                if d.startswith("SCAN ") and not d.startswith("SCAN (")
+                and "VIRTUAL TABLE INDEX" not in d
+            })
+            status = "FAIL" if scans else "ok"
+            click.echo(f"{status:4}  {' + '.join(combo)}")
+            for detail in scans:
+                click.echo(f"      {detail}")
+            failures += bool(scans)
+
+    conn.close()
+    if failures:
+        raise click.ClickException(f"{failures} filter combination(s) fall back to a scan")
+
+@app.cli.command("checkpoint")
+@click.option("--mode", type=click.Choice(["PASSIVE", "FULL", "RESTART", "TRUNCATE"]), default="TRUNCATE")
+def checkpoint_command(mode):
+    """Checkpoint the WAL into the database file."""
+    conn = connect()
+    try:
+        size = wal_size()
+        busy, frames, done = checkpoint(conn, mode)
+    finally:
+        conn.close()
+    click.echo(f"{mode}: {done}/{frames} frames checkpointed, WAL {size} -> {wal_size()} bytes")
+    if busy:
+        raise click.ClickException("checkpoint incomplete: a reader or writer was active")
+
+@app.cli.command("rebuild-rollup")
+@click.option("--check", "check_only", is_flag=True, help="Only compare, don't rebuild.")
+def rebuild_rollup(check_only):
+    """Recompute item_rollup and item_rollup_hour from items and verify they match."""
+    conn = connect()
+    rollups = {
+        "item_rollup": ("SELECT day, line, shift, reason, n FROM item_rollup", ROLLUP_SELECT),
+        "item_rollup_hour": ("SELECT day, hour, line, shift, reason, n FROM item_rollup_hour", hour_rollup_select()),
+    }
+
+    def drift():
+        return {
+            table: conn.execute(f"""
+                SELECT
+                  (SELECT COUNT(*) FROM ({expected} EXCEPT {rollup}))
+                  + (SELECT COUNT(*) FROM ({rollup} EXCEPT {expected}))
+            """).fetchone()[0]
+            for table, (rollup, expected) in rollups.items()
+        }
+
+    try:
+        before = drift()
+        click.echo(f"rollup groups out of step with items: {before['item_rollup']}")
+        click.echo(f"hour rollup groups out of step with items: {before['item_rollup_hour']}")
+        if check_only:
+            if any(before.values()):
+                raise click.ClickException("rollups do not match items")
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        refill_rollups(conn)
+        after = drift()
+        if any(after.values()):
+            conn.rollback()
+            raise click.ClickException(f"rebuilt rollups still differ from items in {sum(after.values())} groups")
+        conn.commit()
+        for table in rollups:
+            groups = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            click.echo(f"rebuilt {table}: {groups} groups, verified against items")
+    finally:
+        conn.close()
+
+def next_month(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+def create_archive(conn, path):
+    # A new month file with item_data, both rollups, the dictionaries and
+    # plant_offsets as in the main database, plus the items view so it can be
+    # read on its own
+    tables = ("item_data", "item_rollup", "item_rollup_hour") + tuple(t for _, t, _ in ITEM_DICTIONARIES) + ("plant_offsets",)
+    schema = conn.execute(
+        f"""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name IN ({','.join('?' * len(tables))}) AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index'
+        """,
+        tables
+    ).fetchall()
+    archive = sqlite3.connect(path)
+    try:
+        for r in schema:
+            archive.execute(r[0])
+        create_items_view(archive)
+        archive.commit()
+    finally:
+        archive.close()
+
+def archive_month(conn, month, start, end):
+    # Copy, then delete. The file is committed before the live rows go, so a
+    # failure in between leaves them live and a rerun copies them again.
+    path = archive_path(month)
+    # A file the catalogue doesn't list (a copy that never got its catalogue
+    # entry, or one a restore replaced) isn't added to
+    if os.path.exists(path) and not conn.execute("SELECT 1 FROM archives WHERE month=?", (month,)).fetchone():
+        set_aside_archives([month], "uncatalogued")
+    if not os.path.exists(path):
+        create_archive(conn, path)
+    name = archive_schema(month)
+    conn.execute(f"ATTACH DATABASE ? AS {name}", (os.path.abspath(path),))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            f"INSERT OR REPLACE INTO {name}.item_data SELECT * FROM main.item_data WHERE created_ts >= ? AND created_ts < ?",
+            (start, end)
+        )
+        for _, table, _ in ITEM_DICTIONARIES:
+            conn.execute(f"INSERT OR REPLACE INTO {name}.{table} SELECT * FROM main.{table}")
+        conn.execute(f"DELETE FROM {name}.plant_offsets")
+        conn.execute(f"INSERT INTO {name}.plant_offsets SELECT * FROM main.plant_offsets")
+        conn.execute(f"DELETE FROM {name}.item_rollup")
+        conn.execute(f"""
+            INSERT INTO {name}.item_rollup (day, line, shift, reason, n)
+            SELECT {plant_strftime_sql("%Y-%m-%d", "created_ts")}, line, shift, reason, COUNT(*)
+            FROM {archive_source(month)}
+            GROUP BY 1, 2, 3, 4
+        """)
+        conn.execute(f"DELETE FROM {name}.item_rollup_hour")
+        conn.execute(
+            f"INSERT INTO {name}.item_rollup_hour (day, hour, line, shift, reason, n) "
+            f"{hour_rollup_select(f'{name}.item_data')}"
+        )
+        conn.commit()
+
+        conn.execute("BEGIN IMMEDIATE")
+        moved = conn.execute(
+            f"DELETE FROM main.item_data WHERE created_ts >= ? AND created_ts < ? AND id IN (SELECT id FROM {name}.item_data)",
+            (start, end)
+        ).rowcount
+        conn.execute(
+            f"""
+            INSERT INTO archives (month, items, first_ts, last_ts, archived_at, last_id)
+            SELECT ?, COUNT(*), MIN(created_ts), MAX(created_ts), CAST(strftime('%s', 'now') AS INTEGER), MAX(id)
+            FROM {name}.item_data
+            WHERE true
+            ON CONFLICT (month) DO UPDATE SET
+              items = excluded.items, first_ts = excluded.first_ts, last_ts = excluded.last_ts,
+              archived_at = excluded.archived_at, last_id = excluded.last_id
+            """,
+            (month,)
+        )
+        bump_versions(conn, "items")
+        publish_changes(conn, "reload")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"DETACH DATABASE {name}")
+    return moved
+
+@app.cli.command("archive")
+@click.option("--months", type=click.IntRange(0), default=ARCHIVE_RETENTION_MONTHS, show_default=True,
+              help="Whole months (besides the current one) to keep live.")
+@click.option("--dry-run", is_flag=True, help="Only count what would be archived.")
+def archive_command(months, dry_run):
+    """Move entries older than the retention window into monthly archive files."""
+    today = plant_today()
+    cutoff = today.replace(day=1)
+    for _ in range(months):
+        cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+
+    conn = connect()
+    try:
+        first = conn.execute("SELECT MIN(created_ts) FROM item_data").fetchone()[0]
+        if first is None or first >= plant_midnight(cutoff.isoformat()):
+            click.echo(f"nothing before {cutoff} to archive")
+            return
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+        day = datetime.fromtimestamp(first, PLANT_ZONE).date().replace(day=1)
+        total = 0
+        while day < cutoff:
+            month = day.strftime("%Y-%m")
+            start, end = plant_midnight(day.isoformat()), plant_midnight(next_month(day).isoformat())
+            day = next_month(day)
+            count = conn.execute(
+                "SELECT COUNT(*) FROM item_data WHERE created_ts >= ? AND created_ts < ?",
+                (start, end)
+            ).fetchone()[0]
+            if not count:
+                continue
+            if dry_run:
+                click.echo(f"{month}: {count} entries would move to {archive_path(month)}")
+                total += count
+                continue
+            moved = archive_month(conn, month, start, end)
+            click.echo(f"{month}: {moved} entries moved to {archive_path(month)}")
+            total += moved
+        click.echo(f"{'would archive' if dry_run else 'archived'} {total} entries from before {cutoff}")
+    finally:
+        conn.close()
+
+init_db()
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,86 @@
+"""Per-request database setup cost, before and after the connection layer.
+
+"before" replays what every route used to do: open data.db, run the schema
+DDL and column checks, seed defaults and commit. "after" borrows the
+per-thread connection from app.db() and runs the request teardown.
+
+    python bench/bench_db.py [iterations]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+workdir = tempfile.mkdtemp(prefix="scrap-bench-")
+os.environ["DB_PATH"] = os.path.join(workdir, "data.db")
+
+import app as tracker  # noqa: E402
+
+
+def legacy_db():
+    conn = sqlite3.connect(tracker.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY,
+        parts TEXT NOT NULL,
+        line TEXT NOT NULL,
+        reason TEXT NOT NULL,
+        sequence INTEGER NOT NULL,
+        shift TEXT NOT NULL,
+        created_at TEXT NOT NULL
+      )
+    """)
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS options (
+        id INTEGER PRIMARY KEY,
+        opt_group TEXT NOT NULL,
+        opt_value TEXT NOT NULL,
+        UNIQUE(opt_group, opt_value)
+      )
+    """)
+    if not tracker.column_exists(conn, "items", "notes"):
+        conn.execute("ALTER TABLE items ADD COLUMN notes TEXT")
+    if not tracker.column_exists(conn, "items", "comments"):
+        conn.execute("ALTER TABLE items ADD COLUMN comments TEXT")
+    tracker.ensure_default_options(conn, "line", tracker.DEFAULT_LINE_OPTIONS)
+    tracker.ensure_default_options(conn, "shift", tracker.DEFAULT_SHIFT_OPTIONS)
+    conn.commit()
+    return conn
+
+
+def before(n):
+    for _ in range(n):
+        conn = legacy_db()
+        conn.close()
+
+
+def after(n):
+    for _ in range(n):
+        with tracker.app.app_context():
+            tracker.db()
+
+
+def timed(fn, n):
+    start = time.perf_counter()
+    fn(n)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before(10)
+    after(10)
+    cost_before = timed(before, n)
+    cost_after = timed(after, n)
+    print(f"iterations: {n}")
+    print(f"before (connect + schema + commit): {cost_before:9.1f} us/request")
+    print(f"after  (borrow per-thread conn):    {cost_after:9.1f} us/request")
+    print(f"speedup: {cost_before / cost_after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
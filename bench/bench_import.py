@@ -0,0 +1,73 @@
+"""Restore throughput for large backups.
+
+Writes synthetic backups with N items, then times restore_backup(), the
+pipeline behind /import, reading the file from disk.
+
+    python bench/bench_import.py [N[,N...]] [--batch-size B]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+workdir = tempfile.mkdtemp(prefix="scrap-bench-")
+os.environ["DB_PATH"] = os.path.join(workdir, "data.db")
+
+import app as tracker  # noqa: E402
+
+REASONS = ["scratch", "dent", "wrong part", "damaged in transit", "missing clip", "paint defect"]
+
+
+def write_backup(path, n):
+    rng = random.Random(n)
+    with open(path, "w", encoding="utf-8") as f:
+        options = {"line": tracker.DEFAULT_LINE_OPTIONS, "shift": tracker.DEFAULT_SHIFT_OPTIONS}
+        f.write('{"options": ' + json.dumps(options) + ', "items": [\n')
+        for i in range(1, n + 1):
+            item = {
+                "id": i,
+                "created_at": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                              f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+                "parts": f"part {rng.randint(1, 5000)}",
+                "line": rng.choice(tracker.DEFAULT_LINE_OPTIONS),
+                "reason": rng.choice(REASONS),
+                "sequence": rng.randint(1, 99999),
+                "shift": rng.choice(tracker.DEFAULT_SHIFT_OPTIONS),
+                "notes": "checked at station" if i % 7 == 0 else None,
+                "comments": None,
+            }
+            f.write(("" if i == 1 else ",\n") + json.dumps(item))
+        f.write("\n]}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="?", default="100000,1000000")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    for n in [int(x) for x in args.sizes.split(",")]:
+        path = os.path.join(workdir, f"backup-{n}.json")
+        write_backup(path, n)
+        size_mb = os.path.getsize(path) / 1e6
+
+        conn = tracker.connect()
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            result = tracker.restore_backup(conn, f, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        conn.close()
+
+        if result["errors"]:
+            sys.exit(f"restore failed: {result['errors'][:3]}")
+        print(f"{n:>9} items  {size_mb:7.1f} MB  {elapsed:7.2f} s  {n / elapsed:10.0f} rows/s")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Database size and query timings before and after dictionary encoding.
+
+Builds a database with the app as it was before migration 10 (items as a
+plain table, taken from git: --baseline, by default the parent of the commit
+that added the migration), loads the bench_suite synthetic history and times
+the baseline's own queries. Then runs migration 10 (item_data with
+line/reason/shift ids behind an items view) and any later ones with the
+current app and times the same calls again. Both databases are VACUUMed before measuring.
+
+    python bench/bench_storage.py [N] [--repeat 5] [--baseline REV] [--output storage.json]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_suite as suite  # noqa: E402  (sets DB_PATH, imports the app)
+
+tracker = suite.tracker
+
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=suite.ROOT, capture_output=True, text=True, check=True).stdout
+
+
+def load_baseline(rev):
+    if rev is None:
+        added = git("log", "--format=%h", "-S", "def migration_dictionary_encoding", "--", "app.py").split()
+        rev = f"{added[-1]}^" if added else "HEAD"
+    path = os.path.join(suite.workdir, "baseline_app.py")
+    with open(path, "w") as f:
+        f.write(git("show", f"{rev}:app.py"))
+    spec = importlib.util.spec_from_file_location("baseline_app", path)
+    baseline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(baseline)
+    assert not hasattr(baseline, "migration_dictionary_encoding"), f"{rev} already has migration 10"
+    return rev, baseline
+
+
+def load_legacy(baseline, n):
+    history = os.path.join(suite.workdir, "history.json")
+    suite.write_history(history, n)
+    conn = baseline.connect()
+    conn.execute("BEGIN")
+    batch = []
+    with open(history, "rb") as f:
+        for kind, value in baseline.iter_backup(f):
+            if kind != "item":
+                continue
+            batch.append(baseline.import_row(value, None))
+            if len(batch) >= 10000:
+                conn.executemany(
+                    "INSERT INTO items (id, parts, line, reason, sequence, shift, created_at, notes, comments) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch
+                )
+                batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO items (id, parts, line, reason, sequence, shift, created_at, notes, comments) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch
+        )
+    conn.commit()
+    conn.close()
+    os.remove(history)
+
+
+def sizes(conn):
+    conn.execute("VACUUM")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    objects = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    tables = ("items", "item_data", "lines", "reasons", "shifts")
+    items = sum(v for k, v in objects.items()
+                if k in tables or k.startswith("idx_item") or k.startswith(tuple(f"sqlite_autoindex_{t}" for t in tables)))
+    return {
+        "file_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+        "items_and_indexes_bytes": items,
+        "fts_bytes": sum(v for k, v in objects.items() if k.startswith("items_fts")),
+    }
+
+
+def timings(app, conn, repeat):
+    # app is the baseline module before the migration, the current one after
+    def clause(**args):
+        return app.apply_filters_sql(app.build_filters(args))
+
+    line = app.DEFAULT_LINE_OPTIONS[0]
+    shift = app.DEFAULT_SHIFT_OPTIONS[0]
+    line_shift, line_shift_params = clause(f_line=line, f_shift=shift)
+    cases = {
+        "count_line_shift_equal": lambda: conn.execute(
+            f"SELECT COUNT(*) FROM items {line_shift}", line_shift_params).fetchone(),
+        "group_by_line_shift_reason_names": lambda: conn.execute(
+            "SELECT line, shift, reason, COUNT(*) FROM items GROUP BY 1, 2, 3").fetchall(),
+        "totals_for_all": lambda: app.totals_for(conn, "", []),
+        "totals_for_line": lambda: app.totals_for(conn, *clause(f_line=line)),
+        "totals_for_q": lambda: app.totals_for(conn, *clause(q="clip")),
+        "fetch_page_line_month": lambda: app.fetch_page(
+            conn, *clause(f_line=line, **{"from": "2025-03-01", "to": "2025-03-31"}),
+            {"before": None, "after": None, "per_page": app.PAGE_SIZE}),
+        "export_scan": lambda: sum(len(rows) for rows in app.iter_item_batches(
+            "", [], app.EXPORT_COLUMNS)),
+    }
+    results = {}
+    for name, fn in cases.items():
+        fn()  # warm the page cache
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            runs.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(runs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("n", nargs="?", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    rev, baseline = load_baseline(args.baseline)
+    baseline.DB_PATH = tracker.DB_PATH = os.path.join(suite.workdir, "legacy.db")
+    baseline.init_db()
+    load_legacy(baseline, args.n)
+
+    conn = baseline.connect()
+    before = {"sizes": sizes(conn), "timings_ms": timings(baseline, conn, args.repeat)}
+    conn.close()
+
+    conn = tracker.connect()
+    start = time.perf_counter()
+    tracker.migrate(conn)
+    migrate_seconds = time.perf_counter() - start
+    after = {"sizes": sizes(conn), "timings_ms": timings(tracker, conn, args.repeat)}
+    conn.close()
+
+    print(f"{args.n} items, baseline {rev}, migrating took {migrate_seconds:.1f} s\n")
+    print(f"{'':32} {'before':>12} {'after':>12} {'ratio':>7}")
+    for section in ("sizes", "timings_ms"):
+        for key, old in before[section].items():
+            new = after[section][key]
+            print(f"{key:32} {old:12.1f} {new:12.1f} {new / old if old else 0:7.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"items": args.n, "baseline": rev, "migrate_seconds": migrate_seconds,
+                       "before": before, "after": after}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""End-to-end benchmark suite with JSON results for comparing versions.
+
+For each size, writes a synthetic year of scrap history (default lines and
+shifts, skewed reasons and parts), loads it through /import, then times
+through the Flask test client:
+
+  - the dashboard (/) under every combination of the filters, with the
+    fragment cache cleared ("cold") and warm
+  - totals_for() and make_bar_data() for the same combinations
+  - /export.csv and /export.json
+
+    python bench/bench_suite.py [--sizes 10000,100000,1000000] [--repeat 5]
+        [--output results.json] [--compare old-results.json]
+
+Results go to bench/bench-results.json (git-ignored) unless --output says otherwise.
+
+Conditional requests are never sent, so nothing is answered with a 304.
+--compare prints each timing as a ratio to an earlier run of this script.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import combinations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+workdir = tempfile.mkdtemp(prefix="scrap-bench-")
+os.environ["DB_PATH"] = os.path.join(workdir, "data.db")
+os.environ["JOBS_DIR"] = os.path.join(workdir, "jobs")
+
+import app as tracker  # noqa: E402
+
+# A few reasons account for most scrap; weights fall off roughly as 1/rank
+REASONS = [
+    "scratch", "dent", "paint defect", "missing clip", "wrong part", "damaged in transit",
+    "torn trim", "cross threaded", "misaligned", "contaminated", "cracked", "short shot",
+    "wrong colour", "bent bracket", "loose connector",
+]
+REASON_WEIGHTS = [1 / (rank + 1) ** 1.2 for rank in range(len(REASONS))]
+PARTS = [
+    "door clip", "bolt M8", "wire harness", "seat bracket", "headliner", "fender",
+    "mirror cap", "dash panel", "hose clamp", "grommet", "bumper cover", "carpet",
+]
+PART_WEIGHTS = [1 / (rank + 1) for rank in range(len(PARTS))]
+LINE_WEIGHTS = [1 / (rank + 1) ** 0.5 for rank in range(len(tracker.DEFAULT_LINE_OPTIONS))]
+START = datetime(2025, 1, 1)
+
+FILTER_SAMPLES = {
+    "f_line": tracker.DEFAULT_LINE_OPTIONS[0],
+    "f_shift": tracker.DEFAULT_SHIFT_OPTIONS[0],
+    "q": "clip",
+    "f_reason": "scratch",
+    "from": "2025-03-01",
+    "to": "2025-03-31",
+}
+
+
+def write_history(path, n):
+    # One year, shift-shaped: BLUE works days, RED nights
+    rng = random.Random(n)
+    with open(path, "w", encoding="utf-8") as f:
+        options = {"line": tracker.DEFAULT_LINE_OPTIONS, "shift": tracker.DEFAULT_SHIFT_OPTIONS}
+        f.write('{"options": ' + json.dumps(options) + ', "items": [\n')
+        for i in range(1, n + 1):
+            shift = rng.choice(tracker.DEFAULT_SHIFT_OPTIONS)
+            hour = rng.randint(6, 17) if shift == tracker.DEFAULT_SHIFT_OPTIONS[0] else (rng.randint(18, 29) % 24)
+            when = START + timedelta(days=rng.randrange(365), hours=hour, minutes=rng.randrange(60))
+            item = {
+                "id": i,
+                "created_at": when.strftime("%Y-%m-%d %H:%M:%S"),
+                "parts": rng.choices(PARTS, PART_WEIGHTS)[0],
+                "line": rng.choices(tracker.DEFAULT_LINE_OPTIONS, LINE_WEIGHTS)[0],
+                "reason": rng.choices(REASONS, REASON_WEIGHTS)[0],
+                "sequence": rng.randint(1, 99999),
+                "shift": shift,
+                "notes": "rework attempted" if i % 11 == 0 else None,
+                "comments": "supplier notified" if i % 29 == 0 else None,
+            }
+            f.write(("" if i == 1 else ",\n") + json.dumps(item))
+        f.write("\n]}\n")
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(runs), "min_ms": min(runs), "runs": len(runs)}
+
+
+def get_ok(client, url):
+    r = client.get(url)
+    assert r.status_code == 200, (url, r.status_code)
+    return len(r.data)
+
+
+def filter_combinations():
+    names = list(FILTER_SAMPLES)
+    yield ()
+    for size in range(1, len(names) + 1):
+        yield from combinations(names, size)
+
+
+def bench_size(client, n, repeat):
+    results = []
+
+    def record(name, timing, **extra):
+        results.append(dict({"size": n, "name": name}, **extra, **timing))
+
+    path = os.path.join(workdir, f"history-{n}.json")
+    write_history(path, n)
+    with open(path, "rb") as f:
+        timing = timed(lambda: client.post(
+            "/import", data={"file": (f, "history.json")}, content_type="multipart/form-data"
+        ), 1)
+    record("import", timing, bytes=os.path.getsize(path))
+    os.remove(path)
+    conn = tracker.connect()
+    count = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    assert count == n, f"import loaded {count} of {n} items"
+
+    for combo in filter_combinations():
+        args = {name: FILTER_SAMPLES[name] for name in combo}
+        label = "+".join(combo) or "none"
+        url = "/?" + "&".join(f"{k}={v.replace(' ', '+')}" for k, v in args.items())
+
+        def cold():
+            tracker.invalidate_fragments("totals", "dropdowns")
+            get_ok(client, url)
+
+        record("home_cold", timed(cold, repeat), filters=label)
+        record("home_warm", timed(lambda: get_ok(client, url), repeat), filters=label)
+
+        clause, params = tracker.apply_filters_sql(tracker.build_filters(args))
+        record("totals_for", timed(lambda: tracker.totals_for(conn, clause, params), repeat), filters=label)
+        by_line = tracker.totals_for(conn, clause, params)["by_line"]
+        # Too quick to time once: 1000 calls per run
+        timing = timed(lambda: [tracker.make_bar_data(by_line) for _ in range(1000)], repeat)
+        record("make_bar_data_x1000", timing, filters=label)
+    conn.close()
+
+    for name, url in (("export_csv", "/export.csv"), ("export_json", "/export.json")):
+        sizes = []
+        timing = timed(lambda: sizes.append(get_ok(client, url)), repeat)
+        record(name, timing, bytes=sizes[-1])
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(r):
+    return (r["size"], r["name"], r.get("filters"))
+
+
+def compare(old_path, results):
+    with open(old_path) as f:
+        old = {result_key(r): r for r in json.load(f)["results"]}
+    print(f"\nvs {old_path} (new / old median; > 1 is slower)")
+    for r in results:
+        before = old.get(result_key(r))
+        if before and before["median_ms"]:
+            ratio = r["median_ms"] / before["median_ms"]
+            flag = "  <-- slower" if ratio > 1.2 else ""
+            print(f"{r['size']:>9}  {r['name']:<20} {r.get('filters', ''):<40} {ratio:6.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(ROOT, "bench", "bench-results.json"))
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    client = tracker.app.test_client()
+    with client.session_transaction() as s:
+        s["logged_in"] = True
+
+    results = []
+    for n in [int(x) for x in args.sizes.split(",")]:
+        start = time.perf_counter()
+        size_results = bench_size(client, n, args.repeat)
+        results.extend(size_results)
+        home = [r["median_ms"] for r in size_results if r["name"] == "home_cold"]
+        print(f"{n:>9} items  {time.perf_counter() - start:7.1f} s  "
+              f"home cold median {statistics.median(home):.1f} ms (worst {max(home):.1f} ms)")
+
+    document = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(document, f, indent=1)
+    print(f"wrote {len(results)} timings to {args.output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
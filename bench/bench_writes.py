@@ -0,0 +1,97 @@
+"""/add latency under concurrent writers, with and without the write queue.
+
+Each mode runs in a fresh interpreter (the settings are read at import):
+WRITE_QUEUE=0 commits every request on its own connection, WRITE_QUEUE=1
+funnels them through the group-committing writer thread. 50 threads post
+/add through the Flask test client.
+
+    python bench/bench_writes.py [--writers 50] [--posts 40] [--synchronous FULL]
+
+The test client runs every request in this one process, so the numbers
+include GIL contention between the 50 threads; compare modes, not absolutes.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_mode(writers, posts):
+    sys.path.insert(0, ROOT)
+    import app as tracker
+
+    def worker(latencies):
+        c = tracker.app.test_client()
+        with c.session_transaction() as s:
+            s["logged_in"] = True
+        for i in range(posts):
+            start = time.perf_counter()
+            r = c.post("/add", data={
+                "parts": f"part {i}", "line": tracker.DEFAULT_LINE_OPTIONS[i % 10],
+                "reason": "scratch", "sequence": str(i), "shift": tracker.DEFAULT_SHIFT_OPTIONS[i % 2],
+            })
+            latencies.append(time.perf_counter() - start)
+            assert r.status_code == 302, r.status_code
+
+    latencies = []
+    threads = [threading.Thread(target=worker, args=(latencies,)) for _ in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "per_sec": len(latencies) / elapsed,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=40)
+    parser.add_argument("--synchronous", default="FULL")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.writers, args.posts)
+        return
+
+    print(f"{args.writers} writers x {args.posts} posts, synchronous={args.synchronous}")
+    for label, queue_on in (("before (commit per request)", "0"), ("after (group commit)", "1")):
+        env = dict(
+            os.environ,
+            DB_PATH=os.path.join(tempfile.mkdtemp(prefix="scrap-bench-"), "data.db"),
+            WRITE_QUEUE=queue_on,
+            SQLITE_SYNCHRONOUS=args.synchronous,
+        )
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", "--writers", str(args.writers), "--posts", str(args.posts)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{label:28}  p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  "
+            f"mean {r['mean_ms']:7.2f} ms  {r['per_sec']:7.0f} req/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Readers and writers running at the same time.
+
+A reader opens a read transaction (as a long export would) and holds it
+while writer threads post /add through the Flask test client. Every
+write has to finish while the reader still holds its snapshot, and the
+reader must keep seeing that snapshot. Exits non-zero otherwise.
+
+    python bench/check_concurrency.py                  # WAL, should pass
+    SQLITE_JOURNAL_MODE=DELETE SQLITE_BUSY_TIMEOUT_MS=1000 \\
+        python bench/check_concurrency.py              # rollback journal, fails
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+workdir = tempfile.mkdtemp(prefix="scrap-bench-")
+os.environ["DB_PATH"] = os.path.join(workdir, "data.db")
+
+import app as tracker  # noqa: E402
+
+WRITERS = 8
+WRITES_PER_WRITER = 25
+HOLD_SECONDS = 3.0
+
+
+def client():
+    c = tracker.app.test_client()
+    with c.session_transaction() as s:
+        s["logged_in"] = True
+    return c
+
+
+def writer(results, n):
+    c = client()
+    for i in range(WRITES_PER_WRITER):
+        r = c.post("/add", data={
+            "parts": f"part {n}-{i}", "line": tracker.DEFAULT_LINE_OPTIONS[0],
+            "reason": "scratch", "sequence": str(i), "shift": tracker.DEFAULT_SHIFT_OPTIONS[0],
+        })
+        results.append((time.perf_counter(), r.status_code))
+
+
+def main():
+    tracker.app.config["TESTING"] = False
+    client().post("/add", data={
+        "parts": "seed", "line": tracker.DEFAULT_LINE_OPTIONS[0], "reason": "seed",
+        "sequence": "1", "shift": tracker.DEFAULT_SHIFT_OPTIONS[0],
+    })
+
+    reader = tracker.connect()
+    reader.execute("BEGIN")
+    seen_before = reader.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    held_from = time.perf_counter()
+
+    results = []
+    threads = [threading.Thread(target=writer, args=(results, n)) for n in range(WRITERS)]
+    for t in threads:
+        t.start()
+
+    time.sleep(HOLD_SECONDS)
+    seen_during = reader.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    released_at = time.perf_counter()
+    reader.rollback()
+    reader.close()
+    for t in threads:
+        t.join()
+
+    ok = [t for t, status in results if status == 302]
+    during = [t for t in ok if t < released_at]
+    print(f"journal mode: {tracker.SQLITE_JOURNAL_MODE}")
+    print(f"writes ok: {len(ok)}/{len(results)}, finished while reader held its snapshot: {len(during)}")
+    print(f"reader snapshot stable: {seen_before} -> {seen_during}")
+    if during:
+        print(f"last concurrent write after {max(during) - held_from:.2f}s of a {HOLD_SECONDS:.0f}s read")
+
+    total = WRITERS * WRITES_PER_WRITER
+    if len(during) != total or seen_before != seen_during:
+        sys.exit("FAIL: writers were blocked by the reader")
+    print("PASS: readers and writers proceeded in parallel")
+
+
+if __name__ == "__main__":
+    main()